@@ -30,39 +30,935 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 
-import gtk
+try:
+    import gtk
+    import gobject
+except ImportError:
+    # Charts can still be rendered in batch mode (see batch)
+    gtk = None
 
+import numpy
 from numpy import arange
-from matplotlib.dates import MinuteLocator, DateFormatter
+import matplotlib
+# Charts are rendered off-screen, GUI embeds its own canvas (see draw_chart)
+matplotlib.use("Agg")
+from matplotlib.dates import MinuteLocator, DateFormatter, date2num
 import pylab
+if gtk is not None:
+    from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg
 
 from csv import reader, writer
 from lxml import etree
 
 from datetime import datetime
+from itertools import izip, islice, chain
+from collections import OrderedDict
+from optparse import OptionParser
+from hashlib import md5
+from cStringIO import StringIO
+import multiprocessing
+import threading
+import json
+import gzip
+import bz2
+import io
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        # xz compressed logs can not be read (see open_log)
+        lzma = None
+try:
+    import resource
+except ImportError:
+    # Memory of profiled stages is not measured (see peak_rss)
+    resource = None
+import cProfile
+import shutil
+import tempfile
+import time
+import sys
 import os
+import re
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
     JMeter Log Class
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# Columnar storage: column name and NumPy type used to keep it in memory
+COLUMNS = (
+    ("timeStamp",       numpy.int64),
+    ("elapsed",         numpy.int32),
+    ("Latency",         numpy.int32),
+    ("bytes",           numpy.int64),
+    ("label",           numpy.int32),
+    ("success",         numpy.bool_),
+    ("allThreads",      numpy.int32),
+    ("secFromStart",    numpy.int32),
+    ("type",            numpy.int8),
+)
+
+# Values of 'type' column (CSV logs carry no type - each row is a sample)
+SAMPLE      = 0
+HTTP_SAMPLE = 1
+
+# Chart types: mode and title (units are added by chart_title)
+CHARTS = (
+    ("art",     "Average Response Time"),
+    ("lat",     "Average Latency"),
+    ("rpt",     "Responses per Second"),
+    ("bpt",     "Throughput"),
+    ("err",     "Error Rate"),
+    ("errc",    "Error Count"),
+    ("vusers",  "Active Threads"),
+    ("art_p50", "Response Time, 50th Percentile"),
+    ("art_p90", "Response Time, 90th Percentile"),
+    ("art_p95", "Response Time, 95th Percentile"),
+    ("art_p99", "Response Time, 99th Percentile"),
+    ("lat_p50", "Latency, 50th Percentile"),
+    ("lat_p90", "Latency, 90th Percentile"),
+    ("lat_p95", "Latency, 95th Percentile"),
+    ("lat_p99", "Latency, 99th Percentile"),
+)
+
+# Summary table: column name and heading (times in ms)
+SUMMARY = (
+    ("label",       "Label"),
+    ("count",       "Samples"),
+    ("errors",      "Errors"),
+    ("error_pct",   "Error %"),
+    ("avg",         "Average"),
+    ("min",         "Min"),
+    ("max",         "Max"),
+    ("p50",         "50% Line"),
+    ("p90",         "90% Line"),
+    ("p95",         "95% Line"),
+    ("p99",         "99% Line"),
+    ("throughput",  "Throughput (/s)"),
+    ("kbps",        "kB/s"),
+    ("kbytes",      "kB"),
+)
+
+def chart_title(mode, time_range, throughput_range):
+    # Chart title with units for time (ms vs. s) and throughput (kB/s vs. MB/s)
+    title = dict(CHARTS)[mode]
+    if mode[:3] == 'art' or mode[:3] == 'lat':
+        title += ' (s)' if time_range else ' (ms)'
+    elif mode == 'bpt':
+        title += ' (MB/s)' if throughput_range else ' (kB/s)'
+    return title
+
+# Sketch resolution: 2**SKETCH_BITS histogram bins per power of two
+SKETCH_BITS = 5
+
+class sketch:
+    # Mergeable quantile sketch of integer values (ms) for many groups, e.g.
+    # label x time bucket. Each group is a log-linear histogram (HDR layout,
+    # relative error below 2**-SKETCH_BITS) kept as sparse (group, bin,
+    # count) entries (int32, int16, int32) sorted by group and bin, so
+    # memory is bounded by the number of distinct bins and sketches merge by
+    # adding counts.
+    def __init__(self, groups, bins, counts):
+        self.groups = groups
+        self.bins   = bins
+        self.counts = counts
+    
+    @staticmethod
+    def build(groups, values):
+        # Sketch of values, group of each value is given by 'groups'
+        values      = numpy.maximum(values, 0).astype(numpy.int64)
+        exponent    = numpy.maximum(numpy.frexp(values)[1]-1-SKETCH_BITS, 0)
+        bins        = (exponent << SKETCH_BITS) + (values >> exponent)
+        return sketch.reduce(groups, bins, None)
+    
+    @staticmethod
+    def reduce(groups, bins, counts):
+        # Sum counts of equal (group, bin) entries
+        keys = (numpy.asarray(groups, dtype = numpy.int64) << 16) + bins
+        keys, inverse = numpy.unique(keys, return_inverse = True)
+        return sketch((keys >> 16).astype(numpy.int32), (keys & 0xFFFF).astype(numpy.int16),
+                      numpy.bincount(inverse, counts).astype(numpy.int32))
+    
+    def select(self, first, size):
+        # Groups first ... first+size-1, renumbered from zero
+        lo, hi = numpy.searchsorted(self.groups, (first, first+size))
+        return sketch(self.groups[lo:hi]-first, self.bins[lo:hi], self.counts[lo:hi])
+    
+    def merge(self, groups):
+        # Merge groups: entries of group g go to group groups[g], negative
+        # group drops entries
+        groups  = numpy.asarray(groups, dtype = numpy.int64)[self.groups]
+        keep    = groups >= 0
+        return sketch.reduce(groups[keep], self.bins[keep], self.counts[keep])
+    
+    @staticmethod
+    def join(parts):
+        # Entries of sketches with disjoint groups, in order of groups
+        return sketch(numpy.concatenate([part.groups for part in parts]),
+                      numpy.concatenate([part.bins for part in parts]),
+                      numpy.concatenate([part.counts for part in parts]))
+    
+    def concat(self, other, offset):
+        # Entries of this sketch followed by entries of other one, groups of
+        # other sketch are shifted by offset
+        return sketch(numpy.concatenate((self.groups, other.groups+offset)),
+                      numpy.concatenate((self.bins, other.bins)),
+                      numpy.concatenate((self.counts, other.counts)))
+    
+    def values(self, bins):
+        # Middle value of histogram bins
+        bins     = numpy.asarray(bins, dtype = numpy.int64)
+        exponent = numpy.maximum((bins >> SKETCH_BITS)-1, 0)
+        lower    = (bins - (exponent << SKETCH_BITS)) << exponent
+        return lower + ((1 << exponent)-1)/2.0
+    
+    def quantile(self, q, first, size):
+        # q-quantile (nearest rank) of groups first ... first+size-1,
+        # empty groups give zero
+        selected = self.select(first, size)
+        counts  = selected.counts
+        total   = numpy.bincount(selected.groups, None if not len(counts) else counts, size).astype(numpy.int64)
+        offset  = numpy.cumsum(total)-total
+        rank    = offset + numpy.maximum(numpy.ceil(q*total), 1).astype(numpy.int64)
+        points  = numpy.zeros(size)
+        if len(counts):
+            position = numpy.searchsorted(numpy.cumsum(counts), rank[total > 0])
+            points[total > 0] = self.values(selected.bins[position])
+        return points
+
+# Rollup pyramid: widths of pre-aggregated time buckets (seconds), each one
+# is a multiple of the previous one. The finest level has no sketches,
+# percentiles of its buckets are computed from rows (see level_sketch).
+ROLLUPS = (1, 5, 30, 60, 300)
+
+# Arrays of rollup level (besides sketches)
+ROLLUP_ARRAYS = ("bucket","label","count","errors","kbytes","kbytes_total","elapsed","Latency","min","max","thread_bucket","threads")
+
+def reduce_groups(keys, sums = {}, mins = {}, maxs = {}, lasts = {}):
+    # Group items by integer key. Returns sorted unique keys, group of each
+    # item and reduced columns: sums, minimums, maximums and last values (in
+    # item order) of given columns.
+    order   = numpy.argsort(keys, kind = "mergesort")
+    keys    = keys[order]
+    first   = numpy.ones(len(keys), dtype = numpy.bool_)
+    first[1:] = keys[1:] != keys[:-1]
+    starts  = numpy.flatnonzero(first)
+    groups  = numpy.empty(len(keys), dtype = numpy.int64)
+    groups[order] = numpy.cumsum(first)-1
+    
+    columns = dict()
+    if len(keys):
+        for name, values in sums.items():
+            columns[name] = numpy.add.reduceat(numpy.asarray(values)[order], starts)
+        for name, values in mins.items():
+            columns[name] = numpy.minimum.reduceat(numpy.asarray(values)[order], starts)
+        for name, values in maxs.items():
+            columns[name] = numpy.maximum.reduceat(numpy.asarray(values)[order], starts)
+        for name, values in lasts.items():
+            columns[name] = numpy.asarray(values)[order][numpy.append(starts[1:], len(keys))-1]
+    else:
+        for name, values in sums.items() + mins.items() + maxs.items() + lasts.items():
+            columns[name] = numpy.asarray(values)[:0]
+    return keys[starts], groups, columns
+
+def merge_columns(first, second):
+    # Merge two sets of columns sorted by timeStamp without sorting: final
+    # position of each row is its own index plus the number of rows of the
+    # other set before it (binary search). Rows of the first set go first
+    # among equal timestamps.
+    into_first  = numpy.searchsorted(second["timeStamp"], first["timeStamp"], "left") + arange(len(first["timeStamp"]))
+    into_second = numpy.searchsorted(first["timeStamp"], second["timeStamp"], "right") + arange(len(second["timeStamp"]))
+    columns = dict()
+    for name in first:
+        column = numpy.empty(len(into_first)+len(into_second), dtype = first[name].dtype)
+        column[into_first]  = first[name]
+        column[into_second] = second[name]
+        columns[name] = column
+    return columns
+
+# Number of rows parsed at once by streaming readers
+CHUNK_ROWS  = 65536
+
+# Number of rows processed at once by passes over columns which may be
+# memory-mapped (sorting, rollup)
+BLOCK_ROWS  = 1 << 20
+
+# Cache of parsed logs: one directory per log with raw column files which
+# are opened with numpy.memmap (bump version when storage format changes)
+CACHE_DIR       = os.path.join(os.path.expanduser("~"), ".pylan", "cache")
+CACHE_VERSION   = 8
+
+# Cache eviction (see evict_cache): total size in bytes (None - unlimited),
+# age in seconds of entries not used since, age of abandoned temporary
+# entries (parsing interrupted)
+CACHE_LIMIT     = 4 << 30
+CACHE_AGE       = 30*86400
+CACHE_STALE     = 86400
+
+# Follow mode: interval (seconds) between checks for rows appended to log
+FOLLOW_INTERVAL = 5
+
+# Trend methods: moving average, exponential moving average, moving median
+TRENDS = (
+    ("sma",     "Moving Average"),
+    ("ema",     "Exponential Average"),
+    ("median",  "Moving Median"),
+)
+
+# Decimation of chart lines denser than chart width in pixels: largest
+# triangle three buckets, minimum and maximum per pixel column, all points
+DECIMATIONS = (
+    ("lttb",    "Largest Triangle"),
+    ("minmax",  "Min/Max per Pixel"),
+    ("none",    "All Points"),
+)
+
+# Chart time axis: matplotlib date number of seconds from start 0
+EPOCH = date2num(datetime(1970, 1, 1))
+
+# Memory bound (bytes) of aggregated series kept by each log (see log_agg)
+SERIES_CACHE    = 64 << 20
+
+def bucket_argmax(values, starts):
+    # Index of the first maximum of each bucket of consecutive items,
+    # buckets start at given (increasing) indexes
+    sizes   = numpy.diff(numpy.append(starts, len(values)))
+    bucket  = numpy.repeat(arange(len(starts)), sizes)
+    hits    = numpy.flatnonzero(values == numpy.maximum.reduceat(values, starts)[bucket])
+    return hits[numpy.unique(bucket[hits], return_index = True)[1]]
+
+class column_buffer:
+    # Growable typed array used to collect parsed chunks of a column
+    def __init__(self, dtype, size = CHUNK_ROWS):
+        self.array  = numpy.empty(size, dtype = dtype)
+        self.size   = 0
+    
+    def extend(self, values):
+        # Append values, doubling the storage when it is exhausted
+        if self.size + len(values) > len(self.array):
+            array = numpy.empty(max(2*len(self.array), self.size+len(values)), dtype = self.array.dtype)
+            array[:self.size] = self.array[:self.size]
+            self.array = array
+        self.array[self.size:self.size+len(values)] = values
+        self.size += len(values)
+    
+    def values(self):
+        # Trimmed array with collected values
+        self.array.resize(self.size, refcheck = False)
+        return self.array
+
+class column_file:
+    # Column collected in raw little-endian file of new cache entry (see
+    # save_cache): parsed chunks are appended to the file, so the column is
+    # never kept in memory
+    def __init__(self, dtype, path):
+        self.dtype  = numpy.dtype(dtype).newbyteorder("<")
+        self.file   = open(path, "wb")
+        self.size   = 0
+    
+    def extend(self, values):
+        # Append values to file
+        numpy.asarray(values, dtype = self.dtype).tofile(self.file)
+        self.size += len(values)
+    
+    def values(self):
+        # Memory map of collected values
+        self.file.close()
+        if not self.size:
+            return numpy.zeros(0, dtype = self.dtype)
+        return numpy.memmap(self.file.name, dtype = self.dtype, mode = "r+", shape = (self.size,))
+
+class column_tail:
+    # Column of followed log with room for appended rows (see jmlog.tail):
+    # rows from a given index on are replaced in place and storage grows by
+    # doubling, so new rows cost O(rows replaced) amortized. Storage of
+    # memory-mapped column is an unlinked temporary file, so the column is
+    # not copied to memory.
+    def __init__(self, column):
+        self.mapped = isinstance(column, numpy.memmap)
+        self.dtype  = column.dtype
+        self.array  = self.allocate(max(2*len(column), CHUNK_ROWS))
+        self.array[:len(column)] = column
+    
+    def allocate(self, size):
+        # Empty storage for 'size' values
+        if not self.mapped:
+            return numpy.empty(size, dtype = self.dtype)
+        storage = tempfile.TemporaryFile()
+        storage.truncate(size*self.dtype.itemsize)
+        return numpy.memmap(storage, dtype = self.dtype, mode = "r+", shape = (size,))
+    
+    def replace(self, first, values):
+        # Column with values from index 'first' on replaced by given values
+        size = first + len(values)
+        if size > len(self.array):
+            array = self.allocate(max(2*len(self.array), size))
+            array[:first] = self.array[:first]
+            self.array = array
+        self.array[first:size] = values
+        return self.array[:size]
+
+def blocks(values, lo, width):
+    # Ranges [lo, hi) of about BLOCK_ROWS items of sorted integers (seconds
+    # of rows, buckets of rollup level) from index lo on, at least one (maybe
+    # empty). Ranges end where values//width changes, so buckets of width
+    # never span two ranges and columns (maybe memory-mapped) are processed
+    # block by block in bounded memory.
+    while True:
+        hi = min(lo + BLOCK_ROWS, len(values))
+        if hi < len(values):
+            hi = numpy.searchsorted(values, int(values[hi])//width*width)
+            if hi <= lo:
+                hi = numpy.searchsorted(values, (int(values[lo])//width+1)*width)
+        yield lo, hi
+        lo = hi
+        if lo >= len(values):
+            break
+
+def take(columns, name, order):
+    # Replace column of dictionary with its rows in given order. Memory-mapped
+    # column is reordered block by block into new file which replaces its
+    # file, the old mapping is released first (mapped files can not be
+    # replaced on Windows), so the dictionary must hold its only reference.
+    column = columns[name]
+    if not isinstance(column, numpy.memmap):
+        columns[name] = column[order]
+        return
+    path, dtype = column.filename, column.dtype
+    output = open(path + ".sorted", "wb")
+    for first in range(0, len(order), BLOCK_ROWS):
+        column[order[first:first+BLOCK_ROWS]].tofile(output)
+    output.close()
+    column = columns[name] = None
+    os.remove(path)
+    os.rename(path + ".sorted", path)
+    if len(order):
+        columns[name] = numpy.memmap(path, dtype = dtype, mode = "r+", shape = (len(order),))
+    else:
+        columns[name] = numpy.zeros(0, dtype = dtype)
+
+# Compressed logs: magic bytes and compression format
+COMPRESSION = (
+    ("\x1f\x8b",                "gzip"),
+    ("BZh",                     "bzip2"),
+    ("\xfd7zXZ\x00",            "xz"),
+)
+
+def open_log(path):
+    # Open log for reading, compressed logs (detected by magic bytes) are
+    # decompressed on the fly. Returns file object, raw file object (its
+    # position is the reading progress, None if unknown) and compression
+    # format (None for plain logs).
+    raw = open(path,"rb")
+    magic = raw.read(6)
+    raw.seek(0)
+    for prefix, compression in COMPRESSION:
+        if magic.startswith(prefix):
+            break
+    else:
+        return raw, raw, None
+    if compression == "gzip":
+        return io.BufferedReader(gzip.GzipFile(fileobj = raw), 1 << 20), raw, compression
+    if compression == "xz":
+        if lzma is None:
+            raw.close()
+            raise IOError("xz compressed logs require lzma module (backports.lzma)")
+        return io.BufferedReader(lzma.LZMAFile(raw), 1 << 20), raw, compression
+    raw.close()
+    return bz2.BZ2File(path, "r", 1 << 20), None, compression
+
+def head_lines(log_file, size):
+    # Lines of file (read from its start) within the first 'size' bytes,
+    # rows appended meanwhile are left for the next read
+    for line in log_file:
+        size -= len(line)
+        if size < 0:
+            break
+        yield line
+
+def cache_entries():
+    # Cache directories with total size of their files and time of last
+    # use (modification time of the newest file, see load_cache)
+    entries = list()
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return entries
+    for name in names:
+        path = os.path.join(CACHE_DIR, name)
+        size, used = 0, 0.0
+        try:
+            used = os.path.getmtime(path)
+            for item in os.listdir(path):
+                stat = os.stat(os.path.join(path, item))
+                size += stat.st_size
+                used = max(used, stat.st_mtime)
+        except OSError:
+            continue
+        entries.append((used, size, path))
+    return sorted(entries)
+
+def evict_cache(limit = CACHE_LIMIT, age = CACHE_AGE, keep = None):
+    # Remove cache entries not used for 'age' seconds, then the least
+    # recently used ones until cache fits in 'limit' bytes (None -
+    # unlimited). Entry 'keep' (e.g. just saved) and temporary entries of
+    # running parsers are kept. Returns number of removed entries.
+    now     = time.time()
+    entries = cache_entries()
+    total   = sum([size for used, size, path in entries])
+    removed = 0
+    for used, size, path in entries:
+        if path == keep:
+            continue
+        if path.endswith(".tmp"):
+            if now-used < CACHE_STALE:
+                continue
+        elif now-used < age and (limit is None or total <= limit):
+            continue
+        shutil.rmtree(path, True)
+        if not os.path.isdir(path):
+            total   -= size
+            removed += 1
+    return removed
+
+class label_registry:
+    # Label interning: every distinct label string is stored once in the
+    # table and gets an integer id (its position) through a hash map, rows
+    # keep ids only. Ids of sample and transaction labels are kept apart.
+    # Log labels can be renamed (grouped) or filtered out by 'rename'
+    # function (see row_filter), it is called once per distinct label.
+    def __init__(self, table = (), rename = None):
+        self.table          = list()
+        self.ids            = dict()
+        self.samples        = set()
+        self.transactions   = set()
+        self.rename         = rename
+        self.aliases        = dict()
+        for label in table:
+            self.add(label)
+    
+    def __getstate__(self):
+        # Rename function (bound method of load filter) is pickled as its
+        # object and name, e.g. for render processes (see batch)
+        state = self.__dict__.copy()
+        if self.rename is not None:
+            state["rename"] = (self.rename.im_self, self.rename.__name__)
+        return state
+    
+    def __setstate__(self, state):
+        # Restore pickled registry (see __getstate__)
+        if state["rename"] is not None:
+            state["rename"] = getattr(*state["rename"])
+        self.__dict__.update(state)
+    
+    def code(self, label):
+        # Id of log label string (-1 if it is filtered out)
+        if self.rename is None:
+            code = self.ids.get(label)
+            if code is None:
+                code = self.add(label)
+            return code
+        code = self.aliases.get(label)
+        if code is None:
+            name = self.rename(label)
+            code = self.aliases[label] = -1 if name is None else self.add(name)
+        return code
+    
+    def add(self, label):
+        # Id of label in the table, new labels are interned and added
+        code = self.ids.get(label)
+        if code is None:
+            if type(label) is str:
+                label = intern(label)
+            code = self.ids[label] = len(self.table)
+            self.table.append(label)
+        return code
+    
+    def codes(self, labels):
+        # Ids of label table (e.g. of another registry) as array for mapping
+        # of label column
+        return numpy.array([self.add(label) for label in labels] or [0], dtype = numpy.int32)
+    
+    def labels(self, codes):
+        # Label strings of ids in order of first appearance
+        return [self.table[code] for code in sorted(codes)]
+
+# Row types kept by load filter (see row_filter)
+ROW_TYPES = (
+    ("all",             "All Rows"),
+    ("samples",         "HTTP Samples"),
+    ("transactions",    "Transactions"),
+)
+
+class row_filter:
+    # Load filter applied to every parsed chunk, so rows out of it are never
+    # stored: include and exclude regexes of log labels, row type (see
+    # ROW_TYPES, rows of flat CSV logs are HTTP samples), successful rows
+    # only and time range in seconds from the earliest row of log (applied
+    # to parsed log when rows are sorted, see jmlog.store). Labels
+    # matching a group regex are charted as one series named by the group
+    # (regex itself if name is empty, name can refer to regex groups, e.g.
+    # \1). Filters are part of log cache fingerprint.
+    def __init__(self, include = "", exclude = "", groups = (), types = "all", success = False, start = None, stop = None):
+        self.include    = include
+        self.exclude    = exclude
+        self.groups     = [(pattern, name) for pattern, name in groups]
+        self.types      = types
+        self.success    = success
+        self.start      = start
+        self.stop       = stop
+        self.compiled   = [re.compile(include) if include else None, re.compile(exclude) if exclude else None,
+                           [(re.compile(pattern), name) for pattern, name in self.groups]]
+    
+    def key(self):
+        # Text of filter settings, empty if all rows are kept
+        if not self.active():
+            return ""
+        return json.dumps([self.include, self.exclude, self.groups, self.types, self.success, self.start, self.stop])
+    
+    def active(self):
+        # Whether any row can be filtered out or relabeled
+        return bool(self.include or self.exclude or self.groups or self.types != "all" or self.success
+                    or self.start is not None or self.stop is not None)
+    
+    def label(self, label):
+        # Chart label of log label, None if rows of label are filtered out
+        include, exclude, groups = self.compiled
+        if include is not None and not include.search(label):
+            return None
+        if exclude is not None and exclude.search(label):
+            return None
+        for pattern, name in groups:
+            match = pattern.search(label)
+            if match:
+                return match.expand(name) if name else pattern.pattern
+        return label
+    
+    def rows(self, chunk, origin, nested):
+        # Mask of kept rows of chunk (typed columns), labels must be encoded
+        # by registry with label method as 'rename'. Row types of nested logs
+        # (XML logs and CSV logs exported from them, see jmlog.nested) are
+        # samples and HTTP samples. Time range is skipped if origin is not
+        # known yet (None).
+        keep = chunk["label"] >= 0
+        if self.types == "samples" and nested:
+            keep &= chunk["type"] == HTTP_SAMPLE
+        elif self.types == "transactions":
+            keep &= chunk["type"] == SAMPLE if nested else False
+        if self.success:
+            keep &= chunk["success"]
+        if self.start is not None and origin is not None:
+            keep &= chunk["timeStamp"] >= origin + long(self.start*1000)
+        if self.stop is not None and origin is not None:
+            keep &= chunk["timeStamp"] < origin + long(self.stop*1000)
+        return keep
+    
+    def window(self, timestamps, origin):
+        # Index range [lo, hi) of sorted timestamps within time range
+        lo, hi = 0, len(timestamps)
+        if self.start is not None:
+            lo = numpy.searchsorted(timestamps, origin + long(self.start*1000))
+        if self.stop is not None:
+            hi = max(lo, numpy.searchsorted(timestamps, origin + long(self.stop*1000)))
+        return lo, hi
+
+def parse_group(text):
+    # Label group of "NAME=REGEX" or "REGEX" form (see row_filter). Name
+    # ends at the first "=", so regex containing "=" (e.g. query string or
+    # lookahead) needs a name, "=REGEX" keeps regex as name.
+    name, separator, pattern = text.partition("=")
+    if not separator:
+        return text, ""
+    return pattern, name
+
+def parse_csv_rows(rows, indexes, label_code):
+    # Convert chunk of CSV rows to typed column arrays. 'indexes' maps column
+    # name to its position in CSV header, 'label_code' encodes label strings.
+    chunk = dict()
+    for name, dtype in COLUMNS:
+        if name == "label":
+            chunk[name] = numpy.array([label_code(row[indexes[name]]) for row in rows], dtype = dtype)
+        elif name == "success":
+            chunk[name] = numpy.array([row[indexes[name]] != "false" for row in rows])
+        elif name in indexes:
+            # Numbers are converted by NumPy text parser in one call
+            values = [row[indexes[name]] for row in rows]
+            chunk[name] = numpy.fromstring(" ".join(values), dtype = dtype, sep = " ")
+            if len(chunk[name]) != len(rows):
+                # Empty or broken values (e.g. allThreads in old logs)
+                chunk[name] = numpy.array([int(value) if value.strip().lstrip("-").isdigit() else 0 for value in values], dtype = dtype)
+    if not "type" in indexes:
+        chunk["type"] = numpy.zeros(len(rows), dtype = numpy.int8)
+    return chunk
+
+def parse_csv_range(task):
+    # Pool worker: parse byte range [start, stop) of CSV log, both borders
+    # are at line starts. Labels are encoded with a local label table which
+    # is returned along with the columns and the earliest timestamp of range,
+    # rows out of load filter (if any) are dropped here.
+    path, start, stop, indexes, nested, filter, origin = task
+    log_file = open(path,"r")
+    log_file.seek(start)
+    log = reader(StringIO(log_file.read(stop-start)))
+    log_file.close()
+    
+    registry = label_registry(rename = filter and filter.label)
+    columns = dict()
+    earliest = None
+    while True:
+        rows = list(islice(log, CHUNK_ROWS))
+        if not rows:
+            break
+        chunk = parse_csv_rows(rows, indexes, registry.code)
+        if len(chunk["timeStamp"]):
+            earliest = min(earliest, long(chunk["timeStamp"].min())) if earliest is not None else long(chunk["timeStamp"].min())
+        if filter is not None:
+            keep = filter.rows(chunk, origin, nested)
+            for name in chunk:
+                chunk[name] = chunk[name][keep]
+        for name, values in chunk.items():
+            columns.setdefault(name, column_buffer(values.dtype)).extend(values)
+    
+    for name in columns:
+        columns[name] = columns[name].values()
+    return columns, registry.table, earliest
+
+def peak_rss():
+    # Peak resident set size of current process in MB (0 if unknown)
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss/1048576.0 if sys.platform == "darwin" else rss/1024.0
+
+class profile_stage:
+    # One call of profiled stage: duration, rows and growth of peak RSS,
+    # nothing is measured or recorded if profiler is disabled on entry
+    def __init__(self, profiler, name, rows = None):
+        self.profiler   = profiler
+        self.name       = name
+        self.rows       = rows
+        self.enabled    = False
+    
+    def __enter__(self):
+        self.enabled    = self.profiler.enabled
+        if self.enabled:
+            self.rss        = peak_rss()
+            self.started    = time.time()
+        return self
+    
+    def __exit__(self, *error):
+        if self.enabled:
+            self.profiler.record(self.name, time.time()-self.started, self.rows, peak_rss()-self.rss)
+        return False
+
+class profiler:
+    # Instrumentation of pipeline stages (parsing, aggregation, trends,
+    # plotting, drawing): calls, time, rows and peak RSS growth summed per
+    # stage, optionally with cProfile statistics of profiled jobs (see run).
+    # Stages may be nested (e.g. series includes log_agg and trend). When
+    # disabled, stages are not recorded and jobs run directly.
+    def __init__(self):
+        self.enabled    = False
+        self.functions  = None
+        self.lock       = threading.Lock()
+        self.jobs       = threading.Lock()
+        self.reset()
+    
+    def enable(self, enabled = True, functions = False):
+        # Record stages, collect cProfile statistics of jobs if functions
+        self.enabled    = enabled
+        self.functions  = cProfile.Profile() if enabled and functions else None
+        self.reset()
+    
+    def reset(self):
+        # Forget recorded stages
+        self.stages = OrderedDict()
+    
+    def stage(self, name, rows = None):
+        # Context of stage call
+        return profile_stage(self, name, rows)
+    
+    def record(self, name, seconds, rows, rss):
+        # Add stage call to totals
+        with self.lock:
+            calls, total, total_rows, total_rss = self.stages.get(name, (0, 0.0, 0, 0.0))
+            self.stages[name] = (calls+1, total+seconds, total_rows+(rows or 0), total_rss+rss)
+    
+    def run(self, function, *args):
+        # Run job (e.g. worker thread), under cProfile if it is enabled;
+        # profiled jobs run one at a time
+        if self.functions is None:
+            return function(*args)
+        with self.jobs:
+            return self.functions.runcall(function, *args)
+    
+    def results(self):
+        # Stage totals, the slowest stage first
+        results = list()
+        for name, (calls, seconds, rows, rss) in self.stages.items():
+            results.append({
+                "stage":            name,
+                "calls":            calls,
+                "seconds":          round(seconds, 4),
+                "rows":             rows,
+                "rows/s":           round(rows/seconds) if rows and seconds else None,
+                "rss_mb":           round(rss, 1),
+            })
+        return sorted(results, key = lambda result: -result["seconds"])
+    
+    def report(self, stages = 6):
+        # Short text of the slowest stages for status bar
+        parts = list()
+        for result in self.results()[:stages]:
+            part = "%s %.2f s" % (result["stage"], result["seconds"])
+            if result["calls"] > 1:
+                part += " (%dx)" % result["calls"]
+            parts.append(part)
+        return "Profile: " + (", ".join(parts) or "no stages")
+    
+    def save(self, path):
+        # Save stage totals in JSON format and cProfile statistics (if any)
+        # next to it (.prof, see pstats module)
+        output = open(path, "w")
+        json.dump({"stages": self.results()}, output, indent = 2)
+        output.close()
+        if self.functions is not None:
+            with self.jobs:
+                self.functions.dump_stats(os.path.splitext(path)[0] + ".prof")
+
+# Profiler shared by logs, GUI and batch mode (disabled by default)
+profile = profiler()
+
+def profiled(name):
+    # Method decorator: calls are recorded as stage of shared profiler with
+    # rows of log, method is called directly when profiler is disabled
+    def decorate(method):
+        def call(self, *args, **kwargs):
+            if not profile.enabled:
+                return method(self, *args, **kwargs)
+            with profile.stage(name) as stage:
+                result = method(self, *args, **kwargs)
+                data = getattr(self, "data", None)
+                if isinstance(data, dict) and "timeStamp" in data:
+                    stage.rows = len(data["timeStamp"])
+            return result
+        call.__name__ = method.__name__
+        return call
+    return decorate
+
 class jmlog:
-    def __init__(self,path,throughput_range,time_range):
+    def __init__(self,path,throughput_range,time_range,cache = True,workers = 1,progress = None,series_limit = SERIES_CACHE,filter = None,cache_limit = CACHE_LIMIT):
         # Options: Throughput (kB/s vs. MB/s) and Time (ms vs. s)
         self.throughput_range   = throughput_range
         self.time_range         = time_range
         
-        # Read the first log line for further validation        
-        log_file = open(path,"r")
-        first_line = log_file.readline()
-        log_file.close()
+        # Trend options: method (see TRENDS) and window in points
+        self.trend_method   = "sma"
+        self.trend_window   = 10
         
-        # Guess file format and perform basic check
-        if first_line == '<?xml version="1.0" encoding="UTF-8"?>\n':
-            if self.validate_xml(path): self.read_xml()
-            else: return None
-        else:
-            if self.validate_csv(first_line): self.read_csv(path)
-            else: return None
+        # Decimation of chart lines (see DECIMATIONS) to number of points
+        # (chart width in pixels, None - all points)
+        self.decimation     = "lttb"
+        self.max_points     = None
+        
+        # Load filter and label grouping (see row_filter), None - all rows
+        self.filter = filter if filter is not None and filter.active() else None
+        
+        # Label registry (dictionary encoding of 'label' column), sample and
+        # transaction labels (see split_labels)
+        self.registry       = label_registry(rename = self.filter and self.filter.label)
+        self.labels         = list()
+        self.transactions   = list()
+        
+        # Last aggregation (see aggregate) and LRU cache of series (see log_agg)
+        self.agg            = None
+        self.series_cache   = OrderedDict()
+        self.series_size    = 0
+        self.series_limit   = series_limit
+        
+        # Path to log file and ingest statistics (see ingest_stats)
+        self.path   = path
+        self.ingest = None
+        
+        # End of parsed part of CSV log (see tail), None for XML logs
+        self.offset = None
+        
+        # Timestamp of the earliest row (origin of secFromStart), None until
+        # log is stored, and the earliest parsed so far (see flush)
+        self.origin     = None
+        self.earliest   = None
+        
+        # Directory of new cache entry, parsed columns go straight to its
+        # files (see save_cache), None if log is not cached
+        self.spill  = None
+        
+        # Columns of followed log with room for appended rows (see tail),
+        # None until the first rows are appended
+        self.tails  = None
+        
+        # Loading progress callback, takes fraction of log processed
+        self.progress = progress
+        
+        # Several logs (e.g. one per JMeter load generator) are loaded one by
+        # one and merged into one timeline
+        if not isinstance(path, basestring):
+            self.name = " + ".join([os.path.basename(name) for name in path])
+            logs = list()
+            for index, name in enumerate(path):
+                def part_progress(fraction, index = index):
+                    self.report((index+fraction)/len(path))
+                log = jmlog(name, throughput_range, time_range, cache, workers, progress and part_progress, series_limit, filter, cache_limit)
+                if log.status != "Valid":
+                    self.status = "%s: %s" % (name, log.status)
+                    return None
+                logs.append(log)
+            self.merge(logs)
+            self.status = "Valid"
+            return None
+        self.name = os.path.basename(path)
+        
+        # Take parsed log from cache if log has not changed since (cache is
+        # kept within limit, see evict_cache)
+        if cache and self.load_cache():
+            evict_cache(cache_limit, CACHE_AGE, self.cache_path())
+            self.status = "Valid"
+            return None
+        
+        if cache:
+            self.spill = self.cache_files()
+        
+        # Read the first log line (of decompressed log) for further validation
+        try:
+            log_file = open_log(path)[0]
+            first_line = log_file.readline()
+            log_file.close()
+            
+            # Guess file format and perform basic check
+            if first_line == '<?xml version="1.0" encoding="UTF-8"?>\n':
+                valid = self.read_xml(path)
+            else:
+                valid = self.validate_csv(first_line) and self.read_csv(path, workers)
+        except (IOError, EOFError) as e:
+            self.status = "Failed to read log: %s" % e
+            valid = False
+        if not valid:
+            if self.spill:
+                shutil.rmtree(self.spill, True)
+            return None
+        
+        # Pre-aggregate samples
+        self.rollup()
+        
+        # Keep parsed log for next sessions, the least recently used logs are
+        # evicted from cache
+        if cache and self.save_cache():
+            evict_cache(cache_limit, CACHE_AGE, self.cache_path())
+    
+    def report(self,fraction):
+        # Report loading progress (None if it is unknown)
+        if self.progress:
+            self.progress(None if fraction is None else min(fraction, 1.0))
     
     def validate_csv(self,line):
         # Validate CSV file header
@@ -76,376 +972,1226 @@ class jmlog:
         self.status = "Valid"
         return True
     
-    def read_csv(self,path):
-        # Open CSV log file from local disk
-        log_file = open(path,"r")
+    @profiled("read_csv")
+    def read_csv(self,path,workers = 1):
+        # Streaming CSV parser: log is read in chunks of CHUNK_ROWS rows and
+        # each chunk goes straight to typed column buffers, so the text of
+        # the whole file is never kept in memory. With several workers the
+        # log is parsed by a pool of processes (see parse_parallel).
+        started = time.time()
         
-        # Initialize container and read data from log
-        self.data=list()
-        self.data.extend(reader(log_file))
-        log_file.close()
-
-        # Append additional column to data array - Seconds from start
-        self.data[0].append("secFromStart")
+        # Open CSV log file from local disk. Log may be still written by
+        # JMeter: only complete lines up to offset are parsed, the rest is
+        # left for tail.
+        # Compressed logs are read sequentially by single process.
+        log_file, raw, compression = open_log(path)
+        size = os.path.getsize(path)
+        if compression:
+            log = reader(log_file)
+            workers = 1
+        else:
+            self.offset = size = self.complete(log_file)
+            log = reader(head_lines(log_file, size))
         
         # Obtain indexes for each column
-        self.sec_index  =   self.index("secFromStart")
-        self.ts_index   =   self.index("timeStamp")
-        self.et_index   =   self.index("elapsed")
-        self.lt_index   =   self.index("Latency")
-        self.b_index    =   self.index("bytes")
-        self.lbl_index  =   self.index("label")
-        self.err_index  =   self.index("success")
-        self.vu_index   =   self.index("allThreads")
-        
-        # New arrays for sample and transaction labels
-        self.labels         = list()
-        self.transactions   = list()
-
-        # Time borders
-        start_time      = long(self.data[1][self.ts_index])
-        self.start      = 0
-        self.start_time = 0
-        self.end_time   = 0
-        
-        # Parse data array
-        for row in range(1,len(self.data)):
-            # Calculate additional column value - Seconds from start
-            current_time = long(self.data[row][self.ts_index])
-            self.data[row].append(int((current_time-start_time)/1000))
-            # Transform string values to integer type
-            self.data[row][self.et_index]   = int(self.data[row][self.et_index])
-            self.data[row][self.lt_index]   = int(self.data[row][self.lt_index])
-            self.data[row][self.b_index]    = int(self.data[row][self.b_index])/1024
-            try:
-                self.data[row][self.vu_index] = int(self.data[row][self.vu_index])
-            except:
-                None
-            # Update end time
-            if self.end_time < self.data[row][-1]:
-                self.end_time = self.data[row][-1]
-            # Update list of labels
-            if not self.data[row][self.lbl_index] in self.labels:
-                self.labels.append(self.data[row][self.lbl_index])
-        # Time borders
-        self.end = self.end_time
+        indexes = self.csv_indexes(log.next())
+        
+        # Log type is told by the first chunk
+        head = list(islice(log, CHUNK_ROWS))
+        if not head:
+            log_file.close()
+            self.status = "Log has no rows"
+            return False
+        nested = self.nested(indexes, head)
+        log = chain(head, log)
+        
+        # Column buffers (files of new cache entry if log is cached)
+        columns = self.buffers(self.spill)
+        
+        # Parse log chunk by chunk
+        if workers > 1:
+            for chunk, position in self.parse_parallel(path, indexes, nested, workers, self.offset):
+                self.flush(columns, chunk, nested)
+                self.report(position/float(max(1, size)))
+        else:
+            while True:
+                rows = list(islice(log, CHUNK_ROWS))
+                if not rows:
+                    break
+                self.flush(columns, parse_csv_rows(rows, indexes, self.registry.code), nested)
+                self.report(raw.tell()/float(max(1, size)) if raw else None)
+        data_size = log_file.tell() if compression else size
+        log_file.close()
+        
+        # Convert buffers to typed arrays
+        if not self.store(columns):
+            self.status = "No rows match load filters"
+            return False
         
-    def validate_xml(self,path):
-        # Basic XML parsing
+        # Every CSV label is a sample label (unless log was exported from XML
+        # log with types of rows)
+        self.split_labels(nested)
+        
+        # Ingest rate
+        self.ingest_stats(started, os.path.getsize(path), data_size = data_size)
+        return True
+    
+    @profiled("merge")
+    def merge(self,logs):
+        # Merge time ordered columns of several logs with a merge tree of
+        # pairwise merges (see merge_columns), labels are mapped to common
+        # label table and time is counted from the earliest log start
+        started = time.time()
+        parts = list()
+        for log in logs:
+            columns = dict()
+            for name, dtype in COLUMNS:
+                if name != "secFromStart":
+                    columns[name] = numpy.asarray(log.data[name])
+            codes = self.registry.codes(log.registry.table)
+            columns["label"] = codes[columns["label"]]
+            parts.append(columns)
+            
+            # Labels and transactions of all logs
+            self.registry.samples.update(codes[list(log.registry.samples)].tolist())
+            self.registry.transactions.update(codes[list(log.registry.transactions)].tolist())
+        while len(parts) > 1:
+            parts = [merge_columns(*parts[index:index+2]) if index+1 < len(parts) else parts[index] for index in range(0, len(parts), 2)]
+        
+        self.labels         = self.registry.labels(self.registry.samples)
+        self.transactions   = self.registry.labels(self.registry.transactions)
+        
+        self.data   = parts[0]
+        self.origin = min([log.origin for log in logs])
+        self.data["secFromStart"] = ((self.data["timeStamp"]-self.origin)//1000).astype(numpy.int32)
+        self.borders()
+        self.rollup()
+        
+        self.ingest_stats(started, sum([log.ingest["bytes"] for log in logs]),
+            not [log for log in logs if not log.ingest["cached"]], sum([log.ingest["parse_seconds"] for log in logs]),
+            sum([log.ingest["data_bytes"] for log in logs]))
+        self.ingest["seconds"] += sum([log.ingest["seconds"] for log in logs])
+    
+    def csv_indexes(self,header):
+        # Map column name to its position in CSV header
+        indexes = dict()
+        for name in ("timeStamp","elapsed","Latency","bytes","label","success","allThreads"):
+            indexes[name] = header.index(name)
+        
+        # Optional column of logs saved by export2csv
+        if "type" in header:
+            indexes["type"] = header.index("type")
+        return indexes
+    
+    def nested(self,indexes,rows):
+        # Whether CSV rows come from nested (XML) log: they have type column
+        # with HTTP samples (rows of flat logs are exported as samples)
+        if not "type" in indexes:
+            return False
+        return str(HTTP_SAMPLE) in set([row[indexes["type"]].strip() for row in rows])
+    
+    def complete(self,log_file):
+        # Size of log without trailing incomplete line (file position is kept)
+        position = log_file.tell()
+        log_file.seek(0, os.SEEK_END)
+        size = log_file.tell()
+        end = size
+        while end > 0:
+            log_file.seek(max(0, end-4096))
+            block = log_file.read(end-max(0, end-4096))
+            if block.rfind("\n") >= 0:
+                end = max(0, end-4096) + block.rfind("\n") + 1
+                break
+            end = max(0, end-4096)
+        log_file.seek(position)
+        return end
+    
+    @profiled("tail")
+    def tail(self):
+        # Follow mode: parse rows appended to CSV log since the last read
+        # (already processed part of file is never read again), merge them
+        # into time ordered columns and rebuild only the affected tail of
+        # rollup pyramid. Returns number of new rows.
+        if self.offset is None:
+            raise ValueError("Follow mode is supported for single uncompressed CSV logs only")
+        log_file = open(self.path,"r")
         try:
-            self.tree = etree.parse(path)
+            header = log_file.readline()
+            if os.path.getsize(self.path) < self.offset:
+                raise ValueError("Log was truncated")
+            log_file.seek(self.offset)
+            end = self.complete(log_file)
+            text = log_file.read(end-self.offset)
+        finally:
+            log_file.close()
+        if not text:
+            return 0
+        
+        # Parse appended rows
+        columns = self.buffers()
+        log = reader(StringIO(text))
+        indexes = self.csv_indexes(reader([header]).next())
+        nested  = None
+        while True:
+            rows = list(islice(log, CHUNK_ROWS))
+            if not rows:
+                break
+            if nested is None:
+                nested = self.nested(indexes, rows)
+            self.flush(columns, parse_csv_rows(rows, indexes, self.registry.code), nested)
+        self.offset = end
+        if not columns["timeStamp"].size:
+            return 0
+        
+        # Appended rows are merged with existing rows from the first
+        # timestamp of new rows on
+        # (threads finish samples out of order), only this suffix of columns
+        # is rewritten (see column_tail)
+        if self.tails is None:
+            self.tails = dict((name, column_tail(self.data[name])) for name, dtype in COLUMNS)
+        rows        = columns["timeStamp"].size
+        timestamps  = columns["timeStamp"].values()
+        first       = numpy.searchsorted(self.data["timeStamp"], timestamps.min(), "right")
+        order       = numpy.argsort(numpy.concatenate((self.data["timeStamp"][first:], timestamps)), kind = "mergesort")
+        data = dict()
+        for name, dtype in COLUMNS:
+            if name != "secFromStart":
+                suffix = numpy.concatenate((self.data[name][first:], columns[name].values()))[order]
+                data[name] = self.tails[name].replace(first, suffix)
+        data["secFromStart"] = self.tails["secFromStart"].replace(first,
+            ((data["timeStamp"][first:]-self.origin)//1000).astype(numpy.int32))
+        
+        # Keep time window unless chart follows the end of log
+        start, end, following = self.start, self.end, self.end == self.end_time
+        self.data = data
+        self.split_labels(bool(self.registry.transactions), first)
+        self.borders()
+        self.start = start
+        if not following:
+            self.end = end
+        
+        # Rebuild buckets of rollup pyramid from the first changed second
+        self.rollup(int(data["secFromStart"][first]))
+        return rows
+        
+    def parse_parallel(self,path,indexes,nested,workers,size):
+        # Parallel CSV parser: log body is split to byte ranges aligned to
+        # line boundaries (several per worker for balancing), ranges are
+        # parsed by worker processes and returned in log order with labels
+        # mapped to this log label table (along with end offset of range).
+        # Note: quoted values with line breaks are not supported here.
+        log_file = open(path,"r")
+        log_file.readline()
+        offsets = [log_file.tell()]
+        parts = max(1, min(4*workers, (size-offsets[0]) >> 20))
+        for part in range(1, parts):
+            position = offsets[0] + (size-offsets[0])*part//parts
+            if position > offsets[-1]:
+                log_file.seek(position-1)
+                log_file.readline()
+                offsets.append(log_file.tell())
+        log_file.close()
+        offsets.append(size)
+        tasks = [(path, start, stop, indexes, nested, self.filter, self.origin) for start, stop in zip(offsets[:-1], offsets[1:]) if stop > start]
+        
+        pool = multiprocessing.Pool(workers)
+        try:
+            for task, (chunk, label_table, earliest) in izip(tasks, pool.imap(parse_csv_range, tasks)):
+                if earliest is not None:
+                    self.earliest = min(self.earliest, earliest) if self.earliest is not None else earliest
+                if "label" in chunk:
+                    codes = self.registry.codes(label_table)
+                    chunk["label"] = codes[chunk["label"]]
+                    yield chunk, task[2]
+        finally:
+            pool.close()
+            pool.join()
+    
+    @profiled("read_xml")
+    def read_xml(self,path):
+        # Incremental XML parser: samples are validated against the JTL
+        # schema (testResults -> sample -> httpSample, required attributes)
+        # as they are parsed, stored in column buffers and then cleared, so
+        # the document tree is never kept in memory
+        started = time.time()
+        
+        # Column buffers (files of new cache entry if log is cached) and rows
+        # of current chunk
+        columns = self.buffers(self.spill)
+        chunk   = self.chunk()
+        
+        # HTTP sample level totals of current transaction
+        elapsedTime=0
+        latency=0
+        
+        log_file, raw, compression = open_log(path)
+        size = max(1, os.path.getsize(path))
+        try:
+            for event, element in etree.iterparse(log_file, events = ("end",)):
+                # Check element structure and attributes
+                error = self.validate_element(element)
+                if error:
+                    self.status = "XML validation failed (line %s): %s" % (element.sourceline, error)
+                    return False
+                
+                if element.tag == "httpSample":
+                    self.xml_row(chunk, element, HTTP_SAMPLE)
+            
+                    # Add sample time and latency to current transaction
+                    elapsedTime += chunk["elapsed"][-1]
+                    latency     += chunk["Latency"][-1]
+                elif element.tag == "sample":
+                    # Transaction level: time and latency are taken from HTTP samples
+                    self.xml_row(chunk, element, SAMPLE)
+                    chunk["elapsed"][-1] = elapsedTime
+                    chunk["Latency"][-1] = latency
+                    elapsedTime=0
+                    latency=0
+                    
+                    # Release parsed elements
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+                
+                    # Move complete chunk to column buffers
+                    if len(chunk["timeStamp"]) >= CHUNK_ROWS:
+                        self.flush(columns, chunk, True)
+                        chunk = self.chunk()
+                        self.report(raw.tell()/float(size) if raw else None)
+            data_size = log_file.tell()
         except etree.XMLSyntaxError as e:
             self.status = str(e)
             return False
+        except ValueError as e:
+            self.status = "XML validation failed: %s" % e
+            return False
+        finally:
+            log_file.close()
+        self.flush(columns, chunk, True)
         
-        # Prepare DTD file
-        schema = '''<!ELEMENT testResults (sample)*>
-            <!ATTLIST testResults version	CDATA	#FIXED "1.2">            
-            <!ELEMENT sample (httpSample)*>
-            <!ATTLIST sample
-                t	CDATA	#REQUIRED
-                lt	CDATA	#REQUIRED
-                ts	CDATA	#REQUIRED
-                s	CDATA	#REQUIRED
-                lb	CDATA	#REQUIRED
-                by	CDATA	#REQUIRED
-                ng	CDATA	#REQUIRED
-                na	CDATA	#REQUIRED
-            >            
-            <!ELEMENT httpSample EMPTY>
-            <!ATTLIST httpSample
-                t	CDATA	#REQUIRED
-                lt	CDATA	#REQUIRED
-                ts	CDATA	#REQUIRED
-                s	CDATA	#REQUIRED
-                lb	CDATA	#REQUIRED
-                by	CDATA	#REQUIRED
-                ng	CDATA	#REQUIRED
-                na	CDATA	#REQUIRED
-            >
-        '''
-        
-        dtd_filename = os.getcwd() + '/temp_dtd.xml'
-        dtd_file = open(dtd_filename,'w')
-        dtd_file.write(schema)
-        dtd_file.close()
-        
-        dtd = etree.DTD(dtd_filename)
-        os.remove(dtd_filename)
-        
-        # DTD Validation
-        if dtd.validate(self.tree):
-            self.status = "Valid"
-            return True
-        else:
-            self.status = "XML validation failed (DTD)"
+        # Convert buffers to typed arrays
+        if not self.store(columns):
+            self.status = "No rows match load filters" if self.filter else "Log has no samples"
             return False
-
-    def read_xml(self):
-        # Data container
-        self.data=list()
         
-        # Data header
-        self.data.append((
-            "timeStamp","elapsed","Latency","bytes",
-            "label","success",
-            "allThreads","secFromStart",
-            "type"))       
+        # Separate sample and transaction labels
+        self.split_labels(True)
         
-        # Time borders
-        start_time = 0        
-        
-        # Parse data array
-        for sample in self.tree.findall("sample"):
-            # Transcation level
-            row = list()    
-            # Append column to transaction row for each attribute
-            row.append(long(sample.get("ts")))
-            row.append(long(sample.get("t")))
-            row.append(long(sample.get("lt")))
-            row.append(long(sample.get("by"))/1024)
-            row.append(sample.get("lb"))
-            row.append(sample.get("s"))
-            row.append(int(sample.get("na")))
-    
-            # Set start time
-            if not start_time:
-                start_time = row[0]
-        
-            row.append(int((row[0]-start_time)/1000))
-            row.append("sample")
-    
-            # HTTP sample level            
-            elapsedTime=0
-            latency=0
-    
-            for httpSample in sample.getchildren():                
-                subRow = list()
-                # Append column to sample row for each attribute
-                subRow.append(long(httpSample.get("ts")))
-                subRow.append(long(httpSample.get("t")))
-                subRow.append(long(httpSample.get("lt")))
-                subRow.append(long(httpSample.get("by"))/1024)
-                subRow.append(httpSample.get("lb"))
-                subRow.append(httpSample.get("s"))
-                subRow.append(int(httpSample.get("na")))
-                subRow.append(int((subRow[0]-start_time)/1000))        
-                subRow.append("httpSample")
-        
-                # Append data to global array
-                self.data.append(subRow)
-        
-                # Add saple time and latentcy to current transaction
-                elapsedTime+=subRow[1]
-                latency+=subRow[2]
-        
-            # Update transactiob time and latency
-            row[1]=elapsedTime
-            row[2]=latency
-    
-            # Append data to global array
-            self.data.append(row)
+        # Ingest rate
+        self.ingest_stats(started, os.path.getsize(path), data_size = data_size)
         
-        # Obtain indexes for each column
-        self.sec_index  =   self.index("secFromStart")
-        self.ts_index   =   self.index("timeStamp")
-        self.et_index   =   self.index("elapsed")
-        self.lt_index   =   self.index("Latency")
-        self.b_index    =   self.index("bytes")
-        self.lbl_index  =   self.index("label")
-        self.err_index  =   self.index("success")
-        self.vu_index   =   self.index("allThreads")
-        self.type_index =   self.index("type")
-
-        # New arrays for sample and transaction labels
-        self.labels         = list()
-        self.transactions   = list()
+        self.status = "Valid"
+        return True
+    
+    def split_labels(self,nested = False,since = 0):
+        # Labels of HTTP samples and of transactions (samples of XML log if
+        # nested) of rows from index 'since' on, every label of flat log is a
+        # sample label
+        registry = self.registry
+        if nested:
+            for first in range(since, len(self.data["label"]), BLOCK_ROWS):
+                codes = self.data["label"][first:first+BLOCK_ROWS]
+                types = self.data["type"][first:first+BLOCK_ROWS]
+                registry.samples.update(numpy.unique(codes[types == HTTP_SAMPLE]).tolist())
+                registry.transactions.update(numpy.unique(codes[types == SAMPLE]).tolist())
+        else:
+            registry.samples.update(range(len(registry.table)))
+        self.labels         = registry.labels(registry.samples)
+        self.transactions   = registry.labels(registry.transactions)
+    
+    def validate_element(self,element):
+        # Validate element against JTL schema, return error message if any:
+        #   <!ELEMENT testResults (sample)*>
+        #   <!ATTLIST testResults version CDATA #FIXED "1.2">
+        #   <!ELEMENT sample (httpSample)*>
+        #   <!ELEMENT httpSample EMPTY>
+        # Both samples require t, lt, ts, s, lb, by, ng and na attributes.
+        parent = element.getparent()
+        if parent is None:
+            if element.tag != "testResults":
+                return "unexpected root element <%s>" % element.tag
+            if element.get("version", "1.2") != "1.2":
+                return "unsupported version %s" % element.get("version")
+            return None
+        if element.tag == "sample":
+            if parent.tag != "testResults":
+                return "<sample> inside <%s>" % parent.tag
+        elif element.tag == "httpSample":
+            if parent.tag != "sample":
+                return "<httpSample> inside <%s>" % parent.tag
+            if len(element):
+                return "<httpSample> must be empty"
+        else:
+            return "unexpected element <%s>" % element.tag
+        for attribute in ("t","lt","ts","s","lb","by","ng","na"):
+            if element.get(attribute) is None:
+                return "<%s> has no '%s' attribute" % (element.tag, attribute)
+        return None
+            
+    def xml_row(self,chunk,element,type):
+        # Append element attributes to chunk rows
+        chunk["timeStamp"].append(long(element.get("ts")))
+        chunk["elapsed"].append(int(element.get("t")))
+        chunk["Latency"].append(int(element.get("lt")))
+        chunk["bytes"].append(long(element.get("by")))
+        chunk["label"].append(self.registry.code(element.get("lb")))
+        chunk["success"].append(element.get("s") != "false")
+        chunk["allThreads"].append(int(element.get("na")))
+        chunk["type"].append(type)
+    
+    def chunk(self):
+        # Empty lists for rows of one chunk
+        chunk = dict()
+        for name, dtype in COLUMNS:
+            chunk[name] = list()
+        return chunk
+    
+    def buffers(self,path = None):
+        # Empty column buffers (secFromStart is derived on store), columns
+        # are collected in files of directory 'path' if given
+        columns = dict()
+        for name, dtype in COLUMNS:
+            columns[name] = column_file(dtype, os.path.join(path, name + ".col")) if path else column_buffer(dtype)
+        return columns
+    
+    def flush(self,columns,chunk,nested = False):
+        # Append parsed chunk to column buffers, only rows of load filter
+        # (nested - rows are samples and HTTP samples, see row_filter). The
+        # earliest timestamp is tracked before rows are filtered.
+        arrays = dict()
+        for name, dtype in COLUMNS:
+            if name in chunk and name != "secFromStart":
+                arrays[name] = numpy.asarray(chunk[name], dtype = dtype)
+        if len(arrays["timeStamp"]):
+            earliest = long(arrays["timeStamp"].min())
+            self.earliest = min(self.earliest, earliest) if self.earliest is not None else earliest
+        if self.filter is not None and len(arrays["timeStamp"]):
+            keep = self.filter.rows(arrays, self.origin, nested)
+            for name in arrays:
+                arrays[name] = arrays[name][keep]
+        for name in arrays:
+            columns[name].extend(arrays[name])
+        
+    def store(self,columns):
+        # Take typed NumPy arrays (or memory maps of column files) from
+        # column buffers, False if no rows are left
+        self.data = dict()
+        for name, dtype in COLUMNS:
+            if name != "secFromStart":
+                self.data[name] = columns[name].values()
+                columns[name] = None
+        
+        # Keep rows in time order: JMeter threads finish samples out of order
+        # and XML transactions follow their HTTP samples. Stable sort keeps
+        # log order of simultaneous samples, column files are reordered
+        # block by block (see take).
+        timestamps = self.data["timeStamp"]
+        if not numpy.all(timestamps[1:] >= timestamps[:-1]):
+            order = numpy.argsort(timestamps, kind = "mergesort")
+            del timestamps
+            for name, dtype in COLUMNS:
+                if name != "secFromStart":
+                    take(self.data, name, order)
+            del order
         
+        # Time is counted from the earliest parsed row (rows out of load
+        # filter included), time range of load filter is cut from sorted rows
+        self.origin = self.earliest
+        rows        = len(self.data["timeStamp"])
+        if self.filter is not None and rows:
+            lo, hi = self.filter.window(self.data["timeStamp"], self.origin)
+            if hi-lo < rows:
+                for name, dtype in COLUMNS:
+                    if name != "secFromStart":
+                        take(self.data, name, arange(lo, hi))
+        timestamps  = self.data["timeStamp"]
+        
+        # Calculate additional column - Seconds from start
+        seconds = columns["secFromStart"]
+        for first in range(0, len(timestamps), BLOCK_ROWS):
+            seconds.extend(((timestamps[first:first+BLOCK_ROWS]-self.origin)//1000).astype(numpy.int32))
+        self.data["secFromStart"] = seconds.values()
+        
+        self.borders()
+        return len(timestamps) > 0
+    
+    def borders(self):
         # Time borders
+        sec = self.data["secFromStart"]
+        self.agg        = None
+        self.series_cache.clear()
+        self.series_size = 0
         self.start_time = 0
         self.start      = 0
-        self.end_time   = 0
-        
-        # What is this block for?
-        for row in range(1,len(self.data)):
-            if self.end_time < self.data[row][self.sec_index]:
-                self.end_time = self.data[row][self.sec_index]
-            if self.data[row][self.type_index] == "httpSample":
-                if not self.data[row][self.lbl_index] in self.labels:
-                    self.labels.append(self.data[row][self.lbl_index])
-            else:
-                if not self.data[row][self.lbl_index] in self.transactions:
-                    self.transactions.append(self.data[row][self.lbl_index])
+        self.end_time   = max(0, int(sec[-1])) if len(sec) else 0
+        self.end        = self.end_time
+    
+    def window(self,start,stop):
+        # Columns restricted to rows with secFromStart in [start, stop). Rows
+        # are in time order, so window is found by binary search in O(log n)
+        # and memory-mapped columns only touch pages of the window.
+        lo, hi = numpy.searchsorted(self.data["secFromStart"], (start, stop))
+        rows = dict()
+        for name, dtype in COLUMNS:
+            rows[name] = self.data[name][lo:hi]
+        return rows
+    
+    def ingest_stats(self,started,size,cached = False,parse_seconds = None,data_size = None):
+        # Ingest rate of the last load: rows/s and bytes/s of log file and of
+        # its data (differ for compressed logs). Loads from cache also keep
+        # the time it took to parse the log originally.
+        elapsed = max(time.time()-started, 1e-6)
+        rows    = len(self.data["timeStamp"])
+        data_size = size if data_size is None else data_size
+        self.ingest = {
+            "rows":             rows,
+            "bytes":            size,
+            "data_bytes":       data_size,
+            "seconds":          elapsed,
+            "rows/s":           rows/elapsed,
+            "bytes/s":          size/elapsed,
+            "data_bytes/s":     data_size/elapsed,
+            "cached":           cached,
+            "parse_seconds":    elapsed if parse_seconds is None else parse_seconds,
+        }
+    
+    def ingest_report(self):
+        # Ingest rate of the last load as text
+        stats = self.ingest
+        if stats["cached"]:
+            return "%d rows loaded from cache in %.1f s (parsing took %.1f s)" % (
+                stats["rows"], stats["seconds"], stats["parse_seconds"])
+        message = "%d rows loaded in %.1f s (%d rows/s, %.1f MB/s" % (
+            stats["rows"], stats["seconds"], stats["rows/s"], stats["data_bytes/s"]/1048576)
+        if stats["data_bytes"] != stats["bytes"]:
+            message += ", %.1f MB/s compressed" % (stats["bytes/s"]/1048576)
+        return message + ")"
+    
+    def cache_path(self):
+        # Cache directory name is derived from absolute log path and load
+        # filter (filtered and complete logs are cached side by side)
+        key = os.path.abspath(self.path)
+        if self.filter:
+            key += "\n" + self.filter.key()
+        return os.path.join(CACHE_DIR, md5(key).hexdigest())
+    
+    def fingerprint(self):
+        # Log identity: cache version, absolute path, size, modification time
+        # and load filter
+        stat = os.stat(self.path)
+        return [str(CACHE_VERSION), os.path.abspath(self.path), str(stat.st_size), repr(stat.st_mtime),
+                self.filter.key() if self.filter else ""]
+    
+    @profiled("load_cache")
+    def load_cache(self):
+        # Open columns saved by save_cache as read-only memory maps, so only
+        # pages actually used by charts are read from disk. Cache is ignored
+        # when it is missing, unreadable or log fingerprint does not match.
+        started = time.time()
+        path = self.cache_path()
+        try:
+            meta = numpy.load(os.path.join(path, "meta.npz"))
+        except (IOError, ValueError):
+            return False
+        try:
+            if meta["fingerprint"].tolist() != self.fingerprint():
+                return False
+            rows = int(meta["rows"])
+            data = dict()
+            for name, dtype in COLUMNS:
+                if rows:
+                    data[name] = numpy.memmap(os.path.join(path, name + ".col"), dtype = dtype, mode = "r", shape = (rows,))
+                else:
+                    data[name] = numpy.zeros(0, dtype = dtype)
+            self.data           = data
+            registry = label_registry(meta["label_table"].tolist(), self.filter and self.filter.label)
+            registry.samples.update(meta["labels"].tolist())
+            registry.transactions.update(meta["transactions"].tolist())
+            parse_seconds       = float(meta["parse_seconds"])
+            self.origin         = long(meta["origin"])
+            self.offset         = long(meta["offset"]) if meta["offset"] >= 0 else None
+            
+            # Rollup pyramid
+            self.rollups = list()
+            for width in ROLLUPS:
+                level = {"width": width}
+                prefix = os.path.join(path, "rollup%d." % width)
+                for name in ROLLUP_ARRAYS:
+                    level[name] = self.load_array(prefix + name + ".npy")
+                for name in ("sketch_elapsed", "sketch_Latency"):
+                    level[name] = None if width == ROLLUPS[0] else sketch(
+                        *[self.load_array(prefix + name + "." + part + ".npy") for part in ("groups","bins","counts")])
+                self.rollups.append(level)
+        except (IOError, KeyError, ValueError):
+            return False
+        finally:
+            meta.close()
         
-        # Time borders
-        self.end = self.end_time
+        self.registry       = registry
+        self.labels         = registry.labels(registry.samples)
+        self.transactions   = registry.labels(registry.transactions)
+        self.borders()
+        
+        # Entry is marked as used (see evict_cache)
+        try:
+            os.utime(os.path.join(path, "meta.npz"), None)
+        except OSError:
+            pass
+        
+        self.ingest_stats(started, os.path.getsize(self.path), True, parse_seconds)
+        return True
+    
+    def cache_files(self):
+        # New temporary cache directory (renamed to cache entry by save_cache),
+        # None if it can not be created
+        path = "%s.%d.tmp" % (self.cache_path(), os.getpid())
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+        except OSError:
+            return None
+        return path
+    
+    @profiled("save_cache")
+    def save_cache(self):
+        # Save parsed log to cache directory: raw little-endian file per
+        # column (already there if columns were parsed to files of new
+        # entry), .npy file per rollup array and meta.npz with fingerprint
+        # and label tables. Failures are
+        # not fatal - log will be parsed again next time.
+        path = self.cache_path()
+        meta = dict()
+        meta["fingerprint"]     = numpy.array(self.fingerprint())
+        meta["rows"]            = numpy.array(len(self.data["timeStamp"]))
+        meta["label_table"]     = numpy.array(self.registry.table or [""])[:len(self.registry.table)]
+        meta["labels"]          = numpy.array(sorted(self.registry.samples), dtype = numpy.int32)
+        meta["transactions"]    = numpy.array(sorted(self.registry.transactions), dtype = numpy.int32)
+        meta["parse_seconds"]   = numpy.array(self.ingest["parse_seconds"])
+        meta["origin"]          = numpy.array(self.origin, dtype = numpy.int64)
+        meta["offset"]          = numpy.array(-1 if self.offset is None else self.offset, dtype = numpy.int64)
+        # Write to temporary directory first, so readers never see partial cache
+        files = self.spill or self.cache_files()
+        self.spill = None
+        if files is None:
+            return False
+        try:
+            for name, dtype in COLUMNS:
+                if not os.path.exists(os.path.join(files, name + ".col")):
+                    self.data[name].astype(numpy.dtype(dtype).newbyteorder("<")).tofile(os.path.join(files, name + ".col"))
+            for level in self.rollups:
+                prefix = os.path.join(files, "rollup%d." % level["width"])
+                for name in ROLLUP_ARRAYS:
+                    numpy.save(prefix + name + ".npy", level[name])
+                for name in ("sketch_elapsed", "sketch_Latency"):
+                    if level[name] is not None:
+                        for part in ("groups","bins","counts"):
+                            numpy.save(prefix + name + "." + part + ".npy", getattr(level[name], part))
+            meta_file = open(os.path.join(files, "meta.npz"), "wb")
+            numpy.savez(meta_file, **meta)
+            meta_file.close()
+        except (IOError, OSError, UnicodeError):
+            return False
+        
+        # Mappings of columns parsed to files are released while directory
+        # is renamed (directory with mapped files can not be moved on
+        # Windows), columns are mapped read-only from cache entry then
+        mapped = list()
+        for name, dtype in COLUMNS:
+            if isinstance(self.data[name], numpy.memmap):
+                mapped.append((name, self.data[name].dtype, self.data[name].shape))
+                self.data[name] = None
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(files, path)
+            saved = True
+        except OSError:
+            path  = files
+            saved = False
+        for name, dtype, shape in mapped:
+            self.data[name] = numpy.memmap(os.path.join(path, name + ".col"), dtype = dtype, mode = "r", shape = shape)
+        return saved
+    
+    def load_array(self,path):
+        # Memory-mapped .npy array (empty arrays can not be mapped)
+        try:
+            return numpy.load(path, mmap_mode = "r")
+        except ValueError:
+            return numpy.load(path)
+    
+    @profiled("rollup")
+    def rollup(self, since = None):
+        # Build rollup pyramid: a level per width in ROLLUPS with per label x
+        # bucket sums (count, errors, kB, kB of transactions, elapsed,
+        # latency), elapsed min/max and response time/latency sketches, plus
+        # the last number of threads of each bucket. Entries are sorted by
+        # bucket and label, counts and buckets are int32. The finest level is
+        # built from rows, coarser ones from the previous level (sketches of
+        # the second level from rows), so charts never touch rows again
+        # except for percentiles of the finest level.
+        # With 'since' (seconds from start) existing levels are kept up to
+        # the bucket containing that second and only the rest is rebuilt.
+        data    = self.data
+        labels  = max(1, len(self.registry.table))
+        
+        # Total kB counts transactions only, every row of log without them
+        # (whatever its type)
+        flat    = not self.registry.transactions
+        
+        rollups = list()
+        for width in ROLLUPS:
+            # First rebuilt bucket of level
+            first = since//width if since is not None else 0
+            if not rollups:
+                # From rows, block by block (blocks end at whole seconds)
+                parts = [self.row_rollup(lo, hi, labels, flat) for lo, hi in self.row_blocks(first*width, width)]
+                keys            = numpy.concatenate([part[0] for part in parts])
+                level           = dict((name, numpy.concatenate([part[1][name] for part in parts])) for name in parts[0][1])
+                threads_keys    = numpy.concatenate([part[2] for part in parts])
+                threads         = {"threads": numpy.concatenate([part[3] for part in parts])}
+                level["sketch_elapsed"] = None
+                level["sketch_Latency"] = None
+            else:
+                # From previous level
+                previous = rollups[-1]
+                factor  = width//previous["width"]
+                lo      = numpy.searchsorted(previous["bucket"], first*factor)
+                keys, groups, level = reduce_groups((previous["bucket"][lo:]//factor).astype(numpy.int64)*labels + previous["label"][lo:],
+                    sums = dict((name, previous[name][lo:]) for name in ("count","errors","kbytes","kbytes_total","elapsed","Latency")),
+                    mins = {"min": previous["min"][lo:]},
+                    maxs = {"max": previous["max"][lo:]})
+                if previous["sketch_elapsed"] is not None:
+                    # Sketches of entries merged block by block (blocks end at
+                    # bucket borders)
+                    elapsed, latency = list(), list()
+                    for start, stop in blocks(previous["bucket"], lo, factor):
+                        merged = groups[start-lo:stop-lo]
+                        elapsed.append(previous["sketch_elapsed"].select(start, stop-start).merge(merged))
+                        latency.append(previous["sketch_Latency"].select(start, stop-start).merge(merged))
+                    level["sketch_elapsed"] = sketch.join(elapsed)
+                    level["sketch_Latency"] = sketch.join(latency)
+                else:
+                    # Rows of rebuilt buckets grouped by entries of level, block
+                    # by block (blocks end at bucket borders)
+                    elapsed, latency = list(), list()
+                    for rows, stop in self.row_blocks(first*width, width):
+                        sec     = data["secFromStart"][rows:stop].astype(numpy.int64)
+                        groups  = numpy.searchsorted(keys, (sec//width)*labels + data["label"][rows:stop])
+                        elapsed.append(sketch.build(groups, data["elapsed"][rows:stop]))
+                        latency.append(sketch.build(groups, data["Latency"][rows:stop]))
+                    level["sketch_elapsed"] = sketch.join(elapsed)
+                    level["sketch_Latency"] = sketch.join(latency)
+                lo      = numpy.searchsorted(previous["thread_bucket"], first*factor)
+                threads_keys, groups, threads = reduce_groups(previous["thread_bucket"][lo:]//factor, lasts = {"threads": previous["threads"][lo:]})
+            level["width"]          = width
+            level["bucket"]         = (keys//labels).astype(numpy.int32)
+            level["label"]          = (keys % labels).astype(numpy.int32)
+            level["thread_bucket"]  = threads_keys.astype(numpy.int32)
+            level["threads"]        = threads["threads"]
             
-    def index(self,column):
-        # Return numerical index for string value (key-value hash)
-        for i in range(len(self.data[0])):
-            if self.data[0][i] == column:
-                return i
-
+            # Join kept part of existing level and rebuilt buckets
+            if since is not None:
+                existing    = self.rollups[len(rollups)]
+                keep        = numpy.searchsorted(existing["bucket"], first)
+                keep_threads = numpy.searchsorted(existing["thread_bucket"], first)
+                for name in ROLLUP_ARRAYS:
+                    kept = keep_threads if name in ("thread_bucket","threads") else keep
+                    level[name] = numpy.concatenate((existing[name][:kept], level[name]))
+                for name in ("sketch_elapsed", "sketch_Latency"):
+                    if level[name] is not None:
+                        level[name] = existing[name].select(0, keep).concat(level[name], keep)
+            rollups.append(level)
+        self.rollups = rollups
+    
+    def row_blocks(self, second, width):
+        # Row ranges of blocks from given second on (see blocks)
+        sec = self.data["secFromStart"]
+        return blocks(sec, numpy.searchsorted(sec, second), width)
+    
+    def row_rollup(self, lo, hi, labels, flat):
+        # Finest rollup level of rows lo ... hi-1 (see rollup): keys of label
+        # x second entries, their arrays, seconds and last numbers of threads
+        data    = self.data
+        sec     = data["secFromStart"][lo:hi].astype(numpy.int64)
+        elapsed = data["elapsed"][lo:hi]
+        latency = data["Latency"][lo:hi]
+        kbytes  = data["bytes"][lo:hi]/1024.0
+        keys, groups, level = reduce_groups(sec*labels + data["label"][lo:hi],
+            sums = {
+                "count":        numpy.ones(len(sec), dtype = numpy.int32),
+                "errors":       (~data["success"][lo:hi]).astype(numpy.int32),
+                "kbytes":       kbytes,
+                "kbytes_total": kbytes if flat else kbytes*(data["type"][lo:hi] == SAMPLE),
+                "elapsed":      elapsed.astype(numpy.int64),
+                "Latency":      latency.astype(numpy.int64)},
+            mins = {"min": elapsed},
+            maxs = {"max": elapsed})
+        threads_keys, groups, threads = reduce_groups(sec, lasts = {"threads": data["allThreads"][lo:hi]})
+        return keys, level, threads_keys, threads["threads"]
+    
+    def level_sketch(self, level, lo, hi, column):
+        # Sketch of column for entries lo ... hi-1 of rollup level (groups
+        # renumbered from zero), sketches of the finest level are built from
+        # rows of its buckets
+        if level["sketch_" + column] is not None:
+            return level["sketch_" + column].select(lo, hi-lo)
+        width   = level["width"]
+        labels  = max(1, len(self.registry.table))
+        keys    = level["bucket"][lo:hi].astype(numpy.int64)*labels + level["label"][lo:hi]
+        rows    = self.window(int(level["bucket"][lo])*width, (int(level["bucket"][hi-1])+1)*width) if hi > lo else self.window(0, 0)
+        groups  = numpy.searchsorted(keys, (rows["secFromStart"]//width).astype(numpy.int64)*labels + rows["label"])
+        return sketch.build(groups, rows[column])
+    
+    def aggregate(self, time_int, labels = None, sketches = False):
+        # Bucketed aggregation engine: sums and counts of every metric for
+        # each label (all labels by default) and for the total, computed in
+        # one pass over the best fitting rollup level (see rollup). Response
+        # time and latency sketches (needed for percentiles) are merged on
+        # request. The last aggregation is reused by
+        # subsequent calls with the same time options and a subset of its
+        # labels (None - totals and threads only), other calls with the same
+        # time options add their labels and sketches to it.
+        if labels is None:
+            labels = self.registry.table
+        labels = [label for label in labels if label is not None]
+        key = (time_int, self.start, self.end)
+        if self.agg and self.agg["key"] == key:
+            if (self.agg["sketch_elapsed"] is not None or not sketches) and not [label for label in labels if not label in self.agg["slots"]]:
+                return self.agg
+            labels      = sorted(self.agg["slots"], key = self.agg["slots"].get) + labels
+            sketches    = sketches or self.agg["sketch_elapsed"] is not None
+        self.agg = self.aggregation(time_int, labels, sketches)
+        return self.agg
+    
+    @profiled("aggregate")
+    def aggregation(self, time_int, labels, sketches):
+        # Aggregation table of labels (see aggregate), a profiled call is a
+        # pass over rollup level
+        key = (time_int, self.start, self.end)
+        
+        # Time buckets: [start, start+time_int), ... up to end time
+        buckets = max(1, -(-(self.end-self.start)//time_int))
+        stop    = self.start + buckets*time_int
+        
+        # Coarsest rollup level aligned with requested buckets, cost of
+        # aggregation is proportional to the number of its entries in window
+        for level in reversed(self.rollups):
+            width = level["width"]
+            if not time_int % width and not self.start % width:
+                break
+        lo, hi  = numpy.searchsorted(level["bucket"], (self.start//width, stop//width))
+        index   = (level["bucket"][lo:hi]*width - self.start)//time_int
+        
+        # Row of aggregation table for each requested label (-1 - not requested)
+        slots   = dict()
+        lookup  = numpy.empty(len(self.registry.table), dtype = numpy.int64)
+        lookup.fill(-1)
+        for label in labels:
+            code = self.registry.ids.get(label)
+            if code is not None and not label in slots:
+                lookup[code] = slots[label] = len(slots)
+        slot = lookup[level["label"][lo:hi]]
+        
+        # Aggregative metrics (throughput counts transactions only)
+        agg = dict()
+        agg["count_total"]  = numpy.bincount(index, level["count"][lo:hi], buckets)
+        agg["errors_total"] = numpy.bincount(index, level["errors"][lo:hi], buckets)
+        agg["bytes_total"]  = numpy.bincount(index, level["kbytes_total"][lo:hi], buckets)
+        
+        # Last reported number of threads, carried over empty intervals
+        first, last = numpy.searchsorted(level["thread_bucket"], (self.start//width, stop//width))
+        thread_index = (level["thread_bucket"][first:last]*width - self.start)//time_int
+        threads = numpy.zeros(buckets)
+        threads[thread_index] = level["threads"][first:last]
+        filled = numpy.zeros(buckets, dtype = numpy.int64)
+        filled[thread_index] = thread_index
+        agg["allThreads"] = threads[numpy.maximum.accumulate(filled)]
+        
+        # Transaction metrics: single bincount per metric on label x bucket keys
+        selected = slot >= 0
+        keys = slot[selected]*buckets + index[selected]
+        shape = (len(slots), buckets)
+        for name, column in (("count","count"),("errors","errors"),("bytes","kbytes"),("elapsed","elapsed"),("Latency","Latency")):
+            agg[name] = numpy.bincount(keys, level[column][lo:hi][selected], shape[0]*buckets).reshape(shape)
+        
+        # Percentile sketches, one group per label x bucket
+        agg["sketch_elapsed"]   = None
+        agg["sketch_Latency"]   = None
+        if sketches:
+            groups = numpy.where(selected, slot*buckets + index, -1)
+            agg["sketch_elapsed"]   = self.level_sketch(level, lo, hi, "elapsed").merge(groups)
+            agg["sketch_Latency"]   = self.level_sketch(level, lo, hi, "Latency").merge(groups)
+        
+        agg["key"]      = key
+        agg["slots"]    = slots
+        agg["time_int"] = time_int
+        agg["steps"]    = self.start + arange(buckets)*time_int
+        return agg
+    
+    @profiled("log_agg")
     def log_agg(self, time_int, label, mode):
         # Calculate and average performance metrics (set by 'mode' parameter)
-        # for specified transaction label and time interval 
-        prev_step = self.start
-        next_step = prev_step+time_int
+        # for specified transaction label and time interval.
+        # Returns bucket start times (seconds from start) and metric values
+        # in log units (ms, kB), recently used series are kept in memory.
+        key = (label, mode, time_int, self.start, self.end)
+        if key in self.series_cache:
+            result = self.series_cache.pop(key)
+        else:
+            result = self.metric(time_int, label, mode)
+            self.series_size += result[0].nbytes + result[1].nbytes
+        self.series_cache[key] = result
         
-        points = dict()
-        points[prev_step] =0
+        # Evict least recently used series
+        while self.series_size > self.series_limit and len(self.series_cache) > 1:
+            steps, points = self.series_cache.popitem(last = False)[1]
+            self.series_size -= steps.nbytes + points.nbytes
+        return result
+    
+    def cached(self, time_int, label, mode):
+        # Whether series is in memory (no aggregation needed)
+        return (label, mode, time_int, self.start, self.end) in self.series_cache
+    
+    def metric(self, time_int, label, mode):
+        # Metric values computed from aggregation table (see log_agg)
+        agg = self.aggregate(time_int, [label], mode.count('_p') > 0)
+        
+        # Is aggregative metric or transaction metric?
+        if mode == 'vusers':
+            return agg["steps"], agg["allThreads"]
+        elif mode.count('_total'):
+            count   = agg["count_total"]
+            errors  = agg["errors_total"]
+            kbytes  = agg["bytes_total"]
+        elif label in agg["slots"]:
+            slot    = agg["slots"][label]
+            count   = agg["count"][slot]
+            errors  = agg["errors"][slot]
+            kbytes  = agg["bytes"][slot]
+        else:
+            return agg["steps"], numpy.zeros(len(agg["steps"]))
+        
+        # Calculate points for each mode (aka metric)
+        if mode.count('_p'):
+            column = "elapsed" if mode[:3] == 'art' else "Latency"
+            buckets = len(agg["steps"])
+            points = agg["sketch_" + column].quantile(int(mode[-2:])/100.0, slot*buckets, buckets)
+        elif mode == 'art' or mode == 'lat':
+            column = "elapsed" if mode == 'art' else "Latency"
+            points = agg[column][agg["slots"][label]]/numpy.maximum(count, 1)
+        elif mode.count('bpt'):
+            points = kbytes/time_int
+        elif mode.count('errc'):
+            points = numpy.cumsum(errors)
+        elif mode.count('err'):
+            points = errors/(time_int*1.0)
+        else:
+            points = count/(time_int*1.0)
+        return agg["steps"], points
 
-        # Poor algorithm for start time calculation - to fix!!!
-        for i in range(1,len(self.data)):
-            if self.data[i][self.sec_index] >= prev_step:
-                row = i
+    @profiled("summary")
+    def summary(self):
+        # Summary statistics of current time window for each label and for
+        # the total (last row): one pass of grouped reductions over entries
+        # of the coarsest fitting rollup level (see rollup), so it does not
+        # depend on the number of samples. Returns list of dicts (see SUMMARY).
+        first   = self.start
+        stop    = self.end + 1
+        for level in reversed(self.rollups):
+            width = level["width"]
+            if not first % width and (not stop % width or self.end >= self.end_time):
                 break
-
-        # Calculation of data points
-        count = 0
-        while prev_step < self.end and row < len(self.data):
-            # Check whether timestamp in current interval
-            if self.data[row][self.sec_index] < next_step:
-                # Is transaction metric?
-                if self.data[row][self.lbl_index] == label:
-                    # Calculate point for each mode (aka metric)
-                    if mode == 'bpt':
-                        points[prev_step] += self.data[row][self.b_index]
-                    elif mode == 'art':
-                        points[prev_step] += self.data[row][self.et_index]
-                        count += 1
-                    elif mode == 'lat':
-                        points[prev_step] += self.data[row][self.lt_index]
-                        count += 1
-                    elif mode == 'rpt':
-                        points[prev_step] += 1
-                    elif mode == 'err' or mode == 'errc':
-                        if self.data[row][self.err_index] == 'false':
-                            points[prev_step] += 1
-                # Or aggregative metric?
-                elif mode == 'err_total' or mode == 'errc_total':
-                    if self.data[row][self.err_index] == 'false':
-                        points[prev_step] += 1
-                elif mode == 'bpt_total':
-                    try:
-                        if self.data[row][self.type_index]=='sample':
-                            points[prev_step] += self.data[row][self.b_index]
-                    except:
-                        points[prev_step] += self.data[row][self.b_index]
-                elif mode == 'rpt_total':
-                    points[prev_step] += 1
-                elif mode == 'vusers':
-                    points[prev_step] = self.data[row][self.vu_index]
-                row += 1
-            else:
-                # Finalize averaging
-                if mode == 'errc' or mode == 'errc_total':
-                    points[next_step] = points[prev_step]
-                elif mode == 'vusers':
-                    None
-                elif mode == 'art' or mode == 'lat':
-                    if count:
-                        points[prev_step] /= count
-                        count = 0
-                    if next_step < self.end:
-                        points[next_step] = 0
-                else:                            
-                    points[prev_step] /= (time_int*1.0)
-                    if next_step < self.end:
-                        points[next_step] = 0
-                # Next time interval
-                prev_step = next_step
-                next_step += time_int
-        return points
-
-    def trend(self,array = list()):
-        # Smooth graph using moving average algorithm        
-        ma = list()
-        for i in range(5):
-            ma.append(array[i])
-        for i in range(5,len(array)-5):
-            smoothed = 0
-            for j in range(i-5,i+5):
-                smoothed+=array[j]/10
-            ma.append(smoothed)
-        for i in range(len(array)-5,len(array)):
-            ma.append(array[i])
-        return ma
-
-    def export2csv(self,path):
-        # Convert XML log to CSV format
+        lo, hi  = numpy.searchsorted(level["bucket"], (first//width, -(-stop//width)))
+        seconds = max(1, min(stop, self.end_time+1) - first)
+        
+        # Per label groups plus the total as one more group
+        codes, groups, columns = reduce_groups(level["label"][lo:hi].astype(numpy.int64),
+            sums = dict((name, level[name][lo:hi].astype(numpy.int64 if name in ("count","errors") else level[name].dtype))
+                        for name in ("count","errors","kbytes","kbytes_total","elapsed")),
+            mins = {"min": level["min"][lo:hi]},
+            maxs = {"max": level["max"][lo:hi]})
+        total = len(codes)
+        for name in ("count","errors","elapsed"):
+            columns[name] = numpy.append(columns[name], columns[name].sum())
+        columns["kbytes"]   = numpy.append(columns["kbytes"], columns["kbytes_total"].sum())
+        columns["min"]      = numpy.append(columns["min"], columns["min"].min() if total else 0)
+        columns["max"]      = numpy.append(columns["max"], columns["max"].max() if total else 0)
+        
+        # Percentiles: sketches merged per label and for all labels
+        elapsed     = self.level_sketch(level, lo, hi, "elapsed")
+        per_label   = elapsed.merge(groups)
+        all_labels  = elapsed.merge(numpy.zeros(len(groups), dtype = numpy.int64))
+        quantiles   = dict()
+        for name in ("p50","p90","p95","p99"):
+            quantiles[name] = numpy.append(per_label.quantile(int(name[1:])/100.0, 0, total),
+                                           all_labels.quantile(int(name[1:])/100.0, 0, 1))
+        
+        rows = list()
+        for index, label in enumerate([self.registry.table[code] for code in codes] + ["Total"]):
+            count = int(columns["count"][index])
+            row = {
+                "label":        label,
+                "count":        count,
+                "errors":       int(columns["errors"][index]),
+                "error_pct":    100.0*columns["errors"][index]/max(count, 1),
+                "avg":          columns["elapsed"][index]/float(max(count, 1)),
+                "min":          int(columns["min"][index]),
+                "max":          int(columns["max"][index]),
+                "throughput":   count/float(seconds),
+                "kbps":         columns["kbytes"][index]/seconds,
+                "kbytes":       float(columns["kbytes"][index]),
+            }
+            for name in quantiles:
+                row[name] = float(quantiles[name][index])
+            rows.append(row)
+        
+        # Transactions first, then samples (by name), total is the last row
+        order = dict((label, index) for index, label in enumerate(sorted(self.transactions) + sorted(self.labels)))
+        rows[:-1] = sorted(rows[:-1], key = lambda row: order.get(row["label"], len(order)))
+        return rows
+    
+    def summary2csv(self,path,rows = None):
+        # Save summary table (current one by default) in CSV format
         log_file = open(path,"wb")
         output = writer(log_file)
+        output.writerow([title for name, title in SUMMARY])
+        for row in rows or self.summary():
+            output.writerow([row[name] if not isinstance(row[name], float) else round(row[name], 3) for name, title in SUMMARY])
+        log_file.close()
+    
+    def summary2json(self,path,rows = None):
+        # Save summary table (current one by default) in JSON format
+        log_file = open(path,"wb")
+        json.dump(rows or self.summary(), log_file, indent = 1, sort_keys = True)
+        log_file.close()
+    
+    @profiled("trend")
+    def trend(self,array = list(),method = None,window = None):
+        # Smooth graph using trend method (see TRENDS) with window of given
+        # number of points, result has the same length as input
+        method = method or self.trend_method
+        window = max(1, window or self.trend_window)
+        array = numpy.asarray(array, dtype = numpy.float64)
+        size = len(array)
+        if not size:
+            return array
         
-        for row in range(len(self.data)):
-            current_row=(
-                self.data[row][self.ts_index],
-                self.data[row][self.et_index],
-                self.data[row][self.lbl_index],
-                self.data[row][self.err_index],
-                self.data[row][self.b_index],
-                self.data[row][self.vu_index],
-                self.data[row][self.lt_index]
-            )
-            output.writerow(current_row)
+        if method == "ema" and window > 1:
+            # Exponential moving average: y[i] = (1-a)*y[i-1] + a*x[i], solved
+            # in closed form blockwise, blocks are limited so that scale factors
+            # (1-a)^-i stay far from overflow
+            alpha   = 2.0/(window+1)
+            decay   = 1.0 - alpha
+            block   = max(1, min(size, int(500/-numpy.log(decay))))
+            scale   = decay**-arange(block, dtype = numpy.float64)
+            ema     = numpy.empty(size)
+            last    = array[0]
+            for first in range(0, size, block):
+                values = array[first:first+block]
+                factors = scale[:len(values)]
+                ema[first:first+len(values)] = (decay*last + alpha*numpy.cumsum(values*factors))/factors
+                last = ema[first+len(values)-1]
+            return ema
+        
+        # Centered window [i-window/2, i-window/2+window), truncated at borders
+        half    = window//2
+        index   = arange(size)
+        lo      = numpy.maximum(index-half, 0)
+        hi      = numpy.minimum(index-half+window, size)
+        if method == "median":
+            # Moving median over edge padded array (in chunks to bound memory)
+            padded = numpy.concatenate((numpy.repeat(array[:1], half), array, numpy.repeat(array[-1:], window-half)))
+            median = numpy.empty(size)
+            for first in range(0, size, CHUNK_ROWS):
+                last = min(size, first+CHUNK_ROWS)
+                windows = numpy.lib.stride_tricks.as_strided(padded[first:], shape = (last-first, window),
+                    strides = (padded.strides[0], padded.strides[0]))
+                median[first:last] = numpy.median(windows, axis = 1)
+            return median
+        
+        # Simple moving average from cumulative sums
+        sums = numpy.concatenate(([0.0], numpy.cumsum(array)))
+        return (sums[hi]-sums[lo])/(hi-lo)
+
+    @profiled("export2csv")
+    def export2csv(self,path,extended = False):
+        # Convert log to CSV format: JMeter columns (plus secFromStart and
+        # type if extended), written from column arrays chunk by chunk
+        names = ["timeStamp","elapsed","label","success","bytes","allThreads","Latency"]
+        if extended:
+            names += ["secFromStart","type"]
+        labels = numpy.array(self.registry.table, dtype = object)
         
+        log_file = open(path,"wb")
+        output = writer(log_file)
+        output.writerow(names)
+        for first in range(0, len(self.data["timeStamp"]), CHUNK_ROWS):
+            columns = list()
+            for name in names:
+                values = self.data[name][first:first+CHUNK_ROWS]
+                if name == "label":
+                    columns.append(labels[values].tolist())
+                elif name == "success":
+                    columns.append(numpy.where(values, "true", "false").tolist())
+                else:
+                    columns.append(values.tolist())
+            output.writerows(izip(*columns))
+        log_file.close()
+    
+    @profiled("export2npz")
+    def export2npz(self,path):
+        # Save log in compact binary columnar format: NumPy .npz bundle with
+        # array per column (labels are codes to label_table) and timestamp
+        # of the start (origin of secFromStart)
+        arrays = dict()
+        for name, dtype in COLUMNS:
+            arrays[name] = numpy.asarray(self.data[name])
+        arrays["label_table"]   = numpy.array(self.registry.table or [""])[:len(self.registry.table)]
+        arrays["origin"]        = numpy.array(self.origin, dtype = numpy.int64)
+        log_file = open(path,"wb")
+        numpy.savez_compressed(log_file, **arrays)
+        log_file.close()
+    
+    @profiled("export_series")
+    def export_series(self,path,time_int,labels = None):
+        # Save pre-aggregated series of current time window in CSV format: a
+        # row per label and time bucket with count, errors, response time and
+        # latency averages, response time percentiles, kB and active threads
+        if labels is None:
+            labels = sorted(self.transactions) + sorted(self.labels)
+        agg     = self.aggregate(time_int, labels, True)
+        steps   = agg["steps"].tolist()
+        buckets = len(steps)
+        
+        log_file = open(path,"wb")
+        output = writer(log_file)
+        output.writerow(("secFromStart","label","count","errors","elapsed","Latency","p50","p90","p95","p99","kbytes","allThreads"))
+        for label in labels:
+            if not label in agg["slots"]:
+                continue
+            slot    = agg["slots"][label]
+            count   = numpy.maximum(agg["count"][slot], 1)
+            columns = [steps, [label]*buckets,
+                       agg["count"][slot].astype(numpy.int64).tolist(),
+                       agg["errors"][slot].astype(numpy.int64).tolist(),
+                       (agg["elapsed"][slot]/count).round(3).tolist(),
+                       (agg["Latency"][slot]/count).round(3).tolist()]
+            for q in (50, 90, 95, 99):
+                columns.append(agg["sketch_elapsed"].quantile(q/100.0, slot*buckets, buckets).tolist())
+            columns.append(agg["bytes"][slot].round(3).tolist())
+            columns.append(agg["allThreads"].astype(numpy.int64).tolist())
+            output.writerows(izip(*columns))
         log_file.close()
    
-    def plot(self, graph = 'bpt_total',time_int = 30, label = None, l_opt = False,ttl=None,trend = False, pnts=False):
-        # Check whether 'Legend' is set and customize plot mode
-        if l_opt:
-            ax = pylab.subplot(2,1,1)
-        else:
-            ax = pylab.subplot(1,1,1)
+    @profiled("decimate")
+    def decimate(self, steps, points):
+        # Indexes of points kept on chart line of max_points width: largest
+        # triangle three buckets (vectorized passes, the first one uses
+        # average of the previous bucket instead of its selected point, next
+        # ones points selected by the previous pass) or
+        # minimum and maximum of each pixel column. Spikes are kept by both
+        # methods, None - line is not decimated.
+        size = len(points)
+        if self.decimation == "none" or not self.max_points or size <= max(self.max_points, 3):
+            return None
+        x = steps.astype(numpy.float64)
+        y = numpy.asarray(points, dtype = numpy.float64)
+        
+        if self.decimation == "minmax":
+            starts = numpy.unique(numpy.linspace(0, size, self.max_points, endpoint = False).astype(numpy.int64))
+            index = numpy.concatenate(([0, size-1], bucket_argmax(y, starts), bucket_argmax(-y, starts)))
+            return numpy.unique(index)
+        
+        # First and last points are kept, others are split into buckets
+        buckets = self.max_points - 2
+        starts  = 1 + (arange(buckets)*(size-2))//buckets
+        sizes   = numpy.diff(numpy.append(starts, size-1))
+        bucket  = numpy.repeat(arange(buckets), sizes)
+        x_avg   = numpy.add.reduceat(x[1:-1], starts-1)/sizes
+        y_avg   = numpy.add.reduceat(y[1:-1], starts-1)/sizes
+        
+        # Triangle of point with the previous and the next bucket
+        x_next  = numpy.append(x_avg[1:], x[-1])[bucket]
+        y_next  = numpy.append(y_avg[1:], y[-1])[bucket]
+        x_prev  = numpy.append(x[0], x_avg[:-1])
+        y_prev  = numpy.append(y[0], y_avg[:-1])
+        for step in range(4):
+            xa = x_prev[bucket]
+            ya = y_prev[bucket]
+            area = numpy.abs((xa - x_next)*(y[1:-1] - ya) - (xa - x[1:-1])*(y_next - ya))
+            selected = 1 + bucket_argmax(area, starts-1)
+            x_prev = numpy.append(x[0], x[selected][:-1])
+            y_prev = numpy.append(y[0], y[selected][:-1])
+        return numpy.concatenate(([0], selected, [size-1]))
+   
+    @profiled("series")
+    def series(self, graph = 'bpt_total', time_int = 30, label = None, trend = False, run = False):
+        # Chart line: time (X axis) and metric values (Y axis) in units set by
+        # options, line label (prefixed by log name for comparison of runs)
+        # and optional trend. Does not touch matplotlib state, so it can be
+        # computed outside of GUI thread.
         
-        # Set graph title
-        pylab.title(ttl)
-
         # Extract data points for specified time interval, transaction label and graph type
-        points = self.log_agg(time_int, label, graph)
+        steps, points = self.log_agg(time_int, label, graph)
         
         # Adjust range
-        throughput_coeff    = 1
-        time_coeff          = 1
         if self.throughput_range and graph.count('bpt'): 
-            for key,value in points.items():
-                points[key] = points[key] / 1024.0
+            points = points / 1024.0
         if self.time_range  and (graph.count('lat') or graph.count('art')):
-            for key,value in points.items():
-                points[key] = points[key] / 1000.0
+            points = points / 1000.0
 
         # Set graph label
         if graph == 'bpt_total'     : label = 'Total Throughput'
         elif graph == 'rpt_total'   : label = 'Total Hits'
         elif graph == 'err_total'   : label = 'Total Error Rate'
         elif graph == 'errc_total'  : label = 'Total Error Count'
+        elif graph == 'vusers'      : label = 'Active Threads'
+        if run:
+            label = "%s: %s" % (self.name, label)
 
-        # Initializes data points arrays
-        x = list()
-        y = list()
-        
-        for key in sorted(points.keys()):
-            # Defines time value (X axis)
-            days = key/86400
-            hours = (key-86400*days)/3600
-            minutes = (key - 86400*days-3600*hours)/60
-            seconds = key - 86400*days-3600*hours-60*minutes
-            days+=1
-            x.append(datetime(1970, 1, days, hours, minutes, seconds))
-            # Defines time value (Y axis)
-            y.append(points[key])
+        # Trend of all points, chart line is decimated to chart width
+        line = self.trend(points) if trend else None
+        index = self.decimate(steps, points)
+        if index is not None:
+            steps   = steps[index]
+            points  = points[index]
+            if trend:
+                line = line[index]
+        
+        # Time (X axis) as date numbers, values (Y axis)
+        return {"label": label, "x": EPOCH + steps/86400.0, "y": points, "trend": line}
+   
+    @profiled("plot")
+    def plot(self, graph = 'bpt_total',time_int = 30, label = None, l_opt = False,ttl=None,trend = False, pnts=False, line = None, run = False):
+        # Check whether 'Legend' is set and customize plot mode
+        if l_opt:
+            ax = pylab.subplot(2,1,1)
+        else:
+            ax = pylab.subplot(1,1,1)
+        
+        # Set graph title
+        pylab.title(ttl)
+        
+        # Chart line (unless computed in advance)
+        if line is None:
+            line = self.series(graph, time_int, label, trend, run)
+        x = line["x"]
+        y = line["y"]
+        label = line["label"]
 
         # Check whether 'Points' is set and customize graph
         if pnts:            
-            pylab.plot(x,y,linestyle='solid',marker='.',markersize=5,label = label, linewidth=0.5)
+            artists = pylab.plot(x,y,linestyle='solid',marker='.',markersize=5,label = label, linewidth=0.5)
         else:            
-            pylab.plot(x,y,label = label, linewidth=0.5)
+            artists = pylab.plot(x,y,label = label, linewidth=0.5)
 
         # Check whether 'Trend' is set and customize graph
-        if trend:
-            pylab.plot(x,self.trend(y),label = label+' (Trend)', linewidth=1)
+        if line["trend"] is not None:
+            artists += pylab.plot(x,line["trend"],label = label+' (Trend)', linewidth=1)
 
         # Activate grid mode
+        ax.xaxis_date()
         pylab.grid(True)
 
         # Evaluate time markers
@@ -478,6 +2224,8 @@ class jmlog:
         if l_opt:
             pylab.legend(bbox_to_anchor=(0, -0.2),loc=2,ncol=1)
         
+        return artists
+        
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
     GUI
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -499,6 +2247,11 @@ class PyLan:
         self.window.vbox.pack_start(self.menubar, True, True, 0)
         self.menubar.show()
         
+        # Status bar
+        self.statusbar = gtk.Statusbar()
+        self.window.vbox.pack_end(self.statusbar, False, False, 0)
+        self.statusbar.show()
+        
         # Initial options
         self.init   = 1
         
@@ -512,8 +2265,45 @@ class PyLan:
         
         self.dpi    = 96
         
+        # Chart canvas: figure is drawn in memory and kept between refreshes,
+        # lines are only updated if chart layout is the same (see draw_chart)
+        self.figure = pylab.figure()
+        self.canvas = FigureCanvasGTKAgg(self.figure)
+        self.canvas.connect("button_press_event", self.refresh)
+        self.canvas_size()
+        self.canvas.show()
+        self.layout     = None
+        self.artists    = list()
+        
+        self.workers    = 1
+        
+        self.trend_method   = "sma"
+        self.trend_window   = 10
+        self.decimation     = "lttb"
+        
+        # Load filter of opened logs (see row_filter)
+        self.filter         = None
+        
+        # Cache of parsed logs and its size limit (see evict_cache)
+        self.cache          = True
+        self.cache_limit    = CACHE_LIMIT
+        
+        # Background jobs: loading and chart computation run in worker
+        # threads, results of outdated jobs (older generation) are dropped
+        self.generation = 0
+        self.busy       = False
+        self.lock       = threading.Lock()
+        self.progress   = None
+        
+        # Follow mode: timer checking log for appended rows (see tail)
+        self.follow_timer   = None
+        self.tailing        = False
+        
         self.title  = 'Average Response Time (ms)'
         self.active = 'art'
+        self.item_factory.get_widget("/Options/Trend/10 points").set_active(True)
+        self.item_factory.get_widget("/Options/Cache/Use Cache").set_active(True)
+        self.item_factory.get_widget("/Options/Cache/Limit 4 GB").set_active(True)
         
         self.preview()
         
@@ -522,8 +2312,14 @@ class PyLan:
         self.menu_items = (
             ( "/_File",                         None,           None,                   0,  "<Branch>" ),
             ( "/File/_Open",                    "<control>O",   self.open_log,          0,  None ),
+            ( "/File/_Compare Runs",            None,           self.open_log,          1,  None ),
             ( "/File/_Save Chart",              "<control>S",   self.save_chart,        0,  None ),
             ( "/File/Save Log",                 None,           self.save_log,          0,  None ),
+            ( "/File/Export/CSV (All Columns)", None,           self.save_log,          1,  None ),
+            ( "/File/Export/NumPy Columns",     None,           self.save_log,          2,  None ),
+            ( "/File/Export/Chart Series",      None,           self.save_log,          3,  None ),
+            ( "/File/Summary",                  "<control>T",   self.show_summary,      0,  None ),
+            ( "/File/Save Profile",             None,           self.save_log,          4,  None ),
             ( "/File/sep1",                     None,           None,                   0,  "<Separator>" ),
             ( "/File/Quit",                     "<control>Q",   gtk.main_quit,          0,  None ),
             ( "/_Chart",                        None,           None,                   0,  "<Branch>" ),
@@ -534,10 +2330,21 @@ class PyLan:
             ( "/Chart/Error Rate",              None,           self.chart_selector,    4,  "/Chart/Reponse Time" ),
             ( "/Chart/Error Count",             None,           self.chart_selector,    5,  "/Chart/Reponse Time" ),
             ( "/Chart/Active Threads",          None,           self.chart_selector,    6,  "/Chart/Reponse Time" ),
+            ( "/Chart/sep1",                    None,           None,                   0,  "<Separator>" ),
+            ( "/Chart/Response Time 50%",       None,           self.chart_selector,    7,  "/Chart/Reponse Time" ),
+            ( "/Chart/Response Time 90%",       None,           self.chart_selector,    8,  "/Chart/Reponse Time" ),
+            ( "/Chart/Response Time 95%",       None,           self.chart_selector,    9,  "/Chart/Reponse Time" ),
+            ( "/Chart/Response Time 99%",       None,           self.chart_selector,    10, "/Chart/Reponse Time" ),
+            ( "/Chart/Latency 50%",             None,           self.chart_selector,    11, "/Chart/Reponse Time" ),
+            ( "/Chart/Latency 90%",             None,           self.chart_selector,    12, "/Chart/Reponse Time" ),
+            ( "/Chart/Latency 95%",             None,           self.chart_selector,    13, "/Chart/Reponse Time" ),
+            ( "/Chart/Latency 99%",             None,           self.chart_selector,    14, "/Chart/Reponse Time" ),
             ( "/_Options",                      None,           None,                   0,  "<Branch>" ),
             ( "/Options/Show Legend",           None,           self.option_selector,   0,  "<CheckItem>" ),
             ( "/Options/Show Trends",           None,           self.option_selector,   1,  "<CheckItem>" ),
             ( "/Options/Show Points",           None,           self.option_selector,   2,  "<CheckItem>" ),
+            ( "/Options/Follow Log",            "<control>F",   self.follow_selector,   0,  "<CheckItem>" ),
+            ( "/Options/Load Filters...",       None,           self.filter_window,     0,  None ),
             ( "/Options/sep1",                  None,           None,                   0,  "<Separator>" ),
             ( "/Options/Throughput/kB\/s",      None,           self.range_selector,    0,  "<RadioItem>" ),
             ( "/Options/Throughput/MB\/s",      None,           self.range_selector,    1,  "/Options/Throughput/kB\/s" ),
@@ -549,6 +2356,30 @@ class PyLan:
             ( "/Options/Font Size/8 pt",        None,           self.font_selector,     8,  "<RadioItem>" ),
             ( "/Options/Font Size/10 pt",       None,           self.font_selector,     10, "/Options/Font Size/8 pt" ),            
             ( "/Options/Font Size/12 pt",       None,           self.font_selector,     12, "/Options/Font Size/8 pt" ),
+            ( "/Options/Trend/Moving Average",  None,           self.trend_selector,    0,  "<RadioItem>" ),
+            ( "/Options/Trend/Exponential Average", None,       self.trend_selector,    1,  "/Options/Trend/Moving Average" ),
+            ( "/Options/Trend/Moving Median",   None,           self.trend_selector,    2,  "/Options/Trend/Moving Average" ),
+            ( "/Options/Trend/sep1",            None,           None,                   0,  "<Separator>" ),
+            ( "/Options/Trend/5 points",        None,           self.window_selector,   5,  "<RadioItem>" ),
+            ( "/Options/Trend/10 points",       None,           self.window_selector,   10, "/Options/Trend/5 points" ),
+            ( "/Options/Trend/30 points",       None,           self.window_selector,   30, "/Options/Trend/5 points" ),
+            ( "/Options/Trend/60 points",       None,           self.window_selector,   60, "/Options/Trend/5 points" ),
+            ( "/Options/Decimation/Largest Triangle",   None,   self.decimation_selector,   0,  "<RadioItem>" ),
+            ( "/Options/Decimation/Min\/Max per Pixel", None,   self.decimation_selector,   1,  "/Options/Decimation/Largest Triangle" ),
+            ( "/Options/Decimation/All Points", None,           self.decimation_selector,   2,  "/Options/Decimation/Largest Triangle" ),
+            ( "/Options/Profiling/Off",         None,           self.profile_selector,  0,  "<RadioItem>" ),
+            ( "/Options/Profiling/Stages",      None,           self.profile_selector,  1,  "/Options/Profiling/Off" ),
+            ( "/Options/Profiling/Stages and Functions", None,  self.profile_selector,  2,  "/Options/Profiling/Off" ),
+            ( "/Options/Parser/Single Process", None,           self.worker_selector,   1,  "<RadioItem>" ),
+            ( "/Options/Parser/All Cores",      None,           self.worker_selector,   0,  "/Options/Parser/Single Process" ),
+            ( "/Options/Cache/Use Cache",       None,           self.cache_selector,    0,  "<CheckItem>" ),
+            ( "/Options/Cache/sep1",            None,           None,                   0,  "<Separator>" ),
+            ( "/Options/Cache/Limit 1 GB",      None,           self.cache_limit_selector,  1,  "<RadioItem>" ),
+            ( "/Options/Cache/Limit 4 GB",      None,           self.cache_limit_selector,  4,  "/Options/Cache/Limit 1 GB" ),
+            ( "/Options/Cache/Limit 16 GB",     None,           self.cache_limit_selector,  16, "/Options/Cache/Limit 1 GB" ),
+            ( "/Options/Cache/No Limit",        None,           self.cache_limit_selector,  0,  "/Options/Cache/Limit 1 GB" ),
+            ( "/Options/Cache/sep2",            None,           None,                   0,  "<Separator>" ),
+            ( "/Options/Cache/Clear Cache",     None,           self.clear_cache,       0,  None ),
         )
         
         # Accelerator group
@@ -569,14 +2400,16 @@ class PyLan:
         # Finally, return the actual menu bar created by the item factory.
         return item_factory.get_widget("<main>")
     
-    def open_log(self,stub1,stub2):
-        # Open file dialog
-        dialog = gtk.FileChooserDialog("Open JMeter Log File",
+    def open_log(self,compare,stub):
+        # Open file dialog: several logs are merged into one (e.g. logs of
+        # load generators) or compared as separate runs
+        dialog = gtk.FileChooserDialog(("Open JMeter Log Files", "Compare JMeter Runs")[compare],
                                None,
                                gtk.FILE_CHOOSER_ACTION_OPEN,
                                (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
                                 gtk.STOCK_OPEN, gtk.RESPONSE_OK))
         dialog.set_default_response(gtk.RESPONSE_OK)
+        dialog.set_select_multiple(True)
         
         # File filter
         filter = gtk.FileFilter()
@@ -585,6 +2418,9 @@ class PyLan:
         filter.add_pattern("*.xml")
         filter.add_pattern("*.csv")
         filter.add_pattern("*.log")
+        for extension in ("gz", "bz2", "xz"):
+            for pattern in ("*.jtl.", "*.xml.", "*.csv.", "*.log."):
+                filter.add_pattern(pattern + extension)
         dialog.add_filter(filter)
 
         filter = gtk.FileFilter()
@@ -592,25 +2428,86 @@ class PyLan:
         filter.add_pattern("*")
         dialog.add_filter(filter)
         
-        # Read file name
+        # Read file names
         response = dialog.run()
-        self.filename = dialog.get_filename()
+        filenames = dialog.get_filenames()
         dialog.destroy()
         
         # Process response
-        if response == gtk.RESPONSE_OK:   
-            # Read log
-            self.log = jmlog(self.filename,self.throughput_range,self.time_range)
-            
-            # Actions based on validation status
-            if self.log.status == "Valid":
-                self.window.set_title("PyLan - " + self.filename)
-                self.window.vbox.remove(self.table)
-    
-                self.init = 0
-                self.preview()
-            else:
-                ww = WarnWindow(self.log.status)
+        if response == gtk.RESPONSE_OK and filenames:   
+            self.start_load(filenames, compare)
+
+    def start_load(self, filenames, compare):
+        # Read logs in background, current chart is kept until they are loaded
+        self.generation += 1
+        if self.progress:
+            self.progress.destroy()
+        self.progress = ProgressBar("Loading " + ", ".join([os.path.basename(name) for name in filenames]))
+        profile.reset()
+        job = threading.Thread(target = profile.run, args = (self.load_log, filenames, compare, self.generation))
+        job.daemon = True
+        job.start()
+
+    def load_log(self, filenames, compare, generation):
+        # Worker thread: read logs, report progress and pass them to main loop
+        def progress(fraction):
+            gobject.idle_add(self.load_progress, fraction, generation)
+        if compare:
+            paths = filenames
+        else:
+            paths = [filenames if len(filenames) > 1 else filenames[0]]
+        runs = list()
+        status = "Valid"
+        try:
+            for index, path in enumerate(paths):
+                def run_progress(fraction, index = index):
+                    progress((index+fraction)/len(paths))
+                log = jmlog(path,self.throughput_range,self.time_range,self.cache,self.workers,run_progress,filter = self.filter,cache_limit = self.cache_limit)
+                if log.status != "Valid":
+                    status = log.status
+                    break
+                runs.append(log)
+        except Exception as e:
+            status = "Failed to load %s: %s" % (", ".join(filenames), e)
+        gobject.idle_add(self.log_loaded, filenames, runs, status, generation)
+
+    def load_progress(self, fraction, generation):
+        # Update progress bar of current loading job
+        if generation == self.generation and self.progress:
+            self.progress.update(fraction)
+        return False
+
+    def log_loaded(self, filenames, runs, status, generation):
+        # Main loop: replace current logs with loaded ones
+        if generation != self.generation:
+            return False
+        if self.progress:
+            self.progress.destroy()
+            self.progress = None
+        
+        # Chart refresh (if any) was cancelled by loading
+        self.busy = False
+        self.statusbar.pop(1)
+        
+        # Actions based on validation status
+        if status == "Valid":
+            self.log    = runs[0]
+            self.runs   = runs
+            self.window.set_title("PyLan - " + ", ".join(filenames))
+            self.report_ingest()
+            self.profile_status()
+            self.window.vbox.remove(self.table)
+
+            self.init = 0
+            self.preview()
+        else:
+            ww = WarnWindow(status)
+        return False
+
+    def report_ingest(self):
+        # Show ingest rate of loaded logs in status bar
+        self.statusbar.pop(0)
+        self.statusbar.push(0, "; ".join([run.ingest_report() for run in self.runs]))
 
     def preview(self):
         # Height basis
@@ -673,14 +2570,15 @@ class PyLan:
         self.table.attach(label, 8, 9, 1+shift, 2+shift)
 
         if not self.init:
-            self.spinner_eh = gtk.SpinButton(gtk.Adjustment(int(self.log.end_time/3600), 0.0, 23.0, 1.0, 4.0, 0.0), 0, 0)
+            end_time = max([run.end_time for run in self.runs])
+            self.spinner_eh = gtk.SpinButton(gtk.Adjustment(int(end_time/3600), 0.0, 23.0, 1.0, 4.0, 0.0), 0, 0)
         else:
             self.spinner_eh = gtk.SpinButton(gtk.Adjustment(0.0, 0.0, 23.0, 1.0, 4.0, 0.0), 0, 0)
         self.spinner_eh.show()
         self.table.attach(self.spinner_eh, 7, 8, 1+shift, 2+shift)
 
         if not self.init:
-            self.spinner_em = gtk.SpinButton(gtk.Adjustment(int((self.log.end_time-int(self.log.end_time/3600)*3600)/60), 0.0, 59.0, 1.0, 5.0, 0.0), 0, 0)
+            self.spinner_em = gtk.SpinButton(gtk.Adjustment(int((end_time-int(end_time/3600)*3600)/60), 0.0, 59.0, 1.0, 5.0, 0.0), 0, 0)
         else:                                             
             self.spinner_em = gtk.SpinButton(gtk.Adjustment(0, 0.0, 59.0, 1.0, 5.0, 0.0), 0, 0)                                    
         self.spinner_em.show()
@@ -704,44 +2602,142 @@ class PyLan:
             
             end_point = self.spinner_em.get_value()*60 + self.spinner_eh.get_value()*3600
             start_point = self.spinner_sm.get_value()*60 + self.spinner_sh.get_value()*3600
-            if end_point < self.log.end_time:
-                self.log.end = max(300,int(end_point))
+            end_time = max([run.end_time for run in self.runs])
+            if end_point < end_time:
+                end = max(300,int(end_point))
             else:
-                self.log.end = self.log.end_time
-            if start_point < self.log.end:
-                self.log.start = int(start_point)
+                end = end_time
+            if start_point < end:
+                start = int(start_point)
             else:
-                self.log.start = max(0,int(self.log.end)-300)
+                start = max(0,int(end)-300)
             
             if time_int:
-                pylab.clf()
+                # Chart lines: graph type and label
                 if self.active == 'vusers':
-                    self.log.plot(self.active, time_int, None, False,self.title,False,False)
+                    lines = [(self.active, None)]
                 else:
-                    for label in self.label_list:
-                        self.log.plot(self.active, time_int, label, self.legend_status,self.title,self.trend_status,self.points_status)
-                    if self.total_status and self.active != 'art' and self.active != 'lat':
-                        self.log.plot(self.active+'_total', time_int, None, self.legend_status, self.title,self.trend_status,self.points_status)
-                pylab.savefig("preview.png", dpi = self.dpi, transparent = False, format = "png")
+                    lines = [(self.active, label) for label in self.label_list]
+                    if self.total_status and self.active[:3] != 'art' and self.active[:3] != 'lat':
+                        lines.append((self.active+'_total', None))
                 
-                try:
-                    self.table.remove(self.button)
-                except:
-                    None
-                
-                # Image object
-                self.image = gtk.Image()
-                self.image.set_from_file("preview.png")
-                self.image.show()
-                os.remove("preview.png")
+                # Snapshot of options, chart is computed in background and
+                # drawn by main loop (unless options are changed meanwhile)
+                options = {
+                    "time_int":         time_int,
+                    "start":            start,
+                    "end":              end,
+                    "lines":            lines,
+                    "sketches":         self.active.count('_p') > 0,
+                    "throughput_range": self.throughput_range,
+                    "time_range":       self.time_range,
+                    "trend_method":     self.trend_method,
+                    "trend_window":     self.trend_window,
+                    "decimation":       self.decimation,
+                    "width":            int(self.figure.get_size_inches()[0]*self.dpi),
+                    "trend":            self.trend_status and self.active != 'vusers',
+                    "legend":           self.legend_status and self.active != 'vusers',
+                    "points":           self.points_status and self.active != 'vusers',
+                    "title":            self.title,
+                }
+                self.generation += 1
+                self.busy = True
+                self.statusbar.pop(1)
+                self.statusbar.push(1, "Refreshing chart...")
+                profile.reset()
+                job = threading.Thread(target = profile.run, args = (self.compute_chart, self.runs, options, self.generation))
+                job.daemon = True
+                job.start()
+
+    @profiled("compute_chart")
+    def compute_chart(self, runs, options, generation):
+        # Worker thread: aggregate all selected labels at once and compute
+        # chart lines of each run (aligned by seconds from start), stop as
+        # soon as newer refresh is requested
+        with self.lock:
+            lines = list()
+            for log in runs:
+                if generation != self.generation:
+                    return
+                log.end                 = min(options["end"], log.end_time)
+                log.start               = min(options["start"], log.end)
+                log.throughput_range    = options["throughput_range"]
+                log.time_range          = options["time_range"]
+                log.trend_method        = options["trend_method"]
+                log.trend_window        = options["trend_window"]
+                log.decimation          = options["decimation"]
+                log.max_points          = options["width"]
                 
-                # Button container
-                self.button = gtk.Button()
-                self.button.add(self.image)
-                self.button.show()
-                self.button.connect("clicked", self.refresh, "1")
+                # Aggregate only labels which are not cached yet
+                missing = [(graph, label) for graph, label in options["lines"] if not log.cached(options["time_int"], label, graph)]
+                if missing:
+                    log.aggregate(options["time_int"], [label for graph, label in missing if label], options["sketches"])
                 
-                self.table.attach(self.button, 0, 10, 0, 24)
+                for graph, label in options["lines"]:
+                    if generation != self.generation:
+                        return
+                    lines.append((graph, log.series(graph, options["time_int"], label, options["trend"], len(runs) > 1)))
+        gobject.idle_add(profile.run, self.draw_chart, runs[0], options, lines, generation)
+
+    def stale(self):
+        # Restart chart computation if it was started with outdated options
+        if self.busy:
+            self.refresh(None, None)
+
+    @profiled("draw_chart")
+    def draw_chart(self, log, options, lines, generation):
+        # Main loop: draw computed chart lines
+        if generation != self.generation:
+            return False
+        self.busy = False
+        self.statusbar.pop(1)
+        
+        # Same lines, axes and options: replace line data only
+        layout = (log, options["start"], options["end"], options["legend"], options["points"], options["title"],
+                  pylab.rcParams['font.size'], [(graph, line["label"], line["trend"] is not None) for graph, line in lines])
+        if layout == self.layout:
+            for artists, (graph, line) in izip(self.artists, lines):
+                artists[0].set_data(line["x"], line["y"])
+                if line["trend"] is not None:
+                    artists[1].set_data(line["x"], line["trend"])
+            for ax in self.figure.axes:
+                ax.relim()
+                ax.autoscale_view()
+        else:
+            self.figure.clf()
+            self.artists = [log.plot(graph, options["time_int"], None, options["legend"], options["title"], False, options["points"], line)
+                            for graph, line in lines]
+            self.layout = layout
+        
+        # Chart canvas is moved to table of current log
+        parent = self.canvas.get_parent()
+        if parent is not self.table:
+            if parent:
+                parent.remove(self.canvas)
+            self.table.attach(self.canvas, 0, 10, 0, 24)
+        
+        # Profiled chart is drawn at once, status is shown when drawing is
+        # recorded
+        if profile.enabled:
+            with profile.stage("canvas_draw"):
+                self.canvas.draw()
+            gobject.idle_add(self.profile_status)
+        else:
+            self.canvas.draw_idle()
+        return False
+
+    def profile_status(self):
+        # Show the slowest stages of the last job in status bar (if profiled)
+        if profile.enabled:
+            self.statusbar.pop(1)
+            self.statusbar.push(1, profile.report())
+        return False
+
+    def canvas_size(self):
+        # Canvas size in pixels for current resolution
+        self.figure.set_dpi(self.dpi)
+        width, height = self.figure.get_size_inches()
+        self.canvas.set_size_request(int(width*self.dpi), int(height*self.dpi))
                 
     def save_chart(self,stub1,stub2):
         # Save chart to PNG file
@@ -762,12 +2758,21 @@ class PyLan:
                     filename = dialog.get_filename()+'.png'
                 else:
                     filename = dialog.get_filename()
-                pylab.savefig(filename, dpi=self.dpi, transparent=False, format="png")
+                with profile.stage("savefig"):
+                    self.figure.savefig(filename, dpi=self.dpi, transparent=False, format="png")
             dialog.destroy()
 
-    def save_log(self,stub1,stub2):
-        # Save log in CSV format
+    def save_log(self,option,stub):
+        # Save log in CSV format (JMeter or all columns), as NumPy columns or
+        # aggregated series of current chart settings
         if not self.init:
+            extension, name, patterns = (
+                (".jtl", "JMeter Logs",     ("*.jtl", "*.csv", "*.log")),
+                (".csv", "CSV Files",       ("*.csv",)),
+                (".npz", "NumPy Columns",   ("*.npz",)),
+                (".csv", "CSV Files",       ("*.csv",)),
+                (".json", "Profiles",       ("*.json",)),
+            )[option]
             dialog = gtk.FileChooserDialog("Save...",
                                     None,
                                    gtk.FILE_CHOOSER_ACTION_SAVE,
@@ -775,20 +2780,98 @@ class PyLan:
                                     gtk.STOCK_SAVE, gtk.RESPONSE_OK))
             dialog.set_default_response(gtk.RESPONSE_OK)
             filter = gtk.FileFilter()
-            filter.set_name("JMeter Logs")
-            filter.add_pattern("*.jtl")
-            filter.add_pattern("*.csv")
-            filter.add_pattern("*.log")
+            filter.set_name(name)
+            for pattern in patterns:
+                filter.add_pattern(pattern)
             dialog.add_filter(filter)
             response = dialog.run()
             if response == gtk.RESPONSE_OK:
-                if dialog.get_filename()[-4:] != '.jtl':
-                    filename = dialog.get_filename()+'.jtl'
+                if not dialog.get_filename().endswith(extension):
+                    filename = dialog.get_filename()+extension
                 else:
                     filename = dialog.get_filename()
-                self.log.export2csv(filename)
+                if option == 4:
+                    profile.save(filename)
+                    dialog.destroy()
+                    return
+                time_int = int(self.sec.get_value()+60*self.min.get_value()) or 60
+                self.statusbar.pop(2)
+                self.statusbar.push(2, "Saving %s..." % os.path.basename(filename))
+                job = threading.Thread(target = profile.run, args = (self.export_log, self.log, option, filename, time_int))
+                job.daemon = True
+                job.start()
             dialog.destroy()
 
+    def export_log(self, log, option, filename, time_int):
+        # Worker thread: save log in chosen format, result is shown by main
+        # loop
+        try:
+            with self.lock:
+                if option == 2:
+                    log.export2npz(filename)
+                elif option == 3:
+                    log.export_series(filename, time_int)
+                else:
+                    log.export2csv(filename, option == 1)
+            status = "Valid"
+        except (IOError, OSError) as e:
+            status = "Failed to save %s: %s" % (filename, e)
+        gobject.idle_add(self.log_exported, filename, status)
+
+    def log_exported(self, filename, status):
+        # Main loop: report saved log
+        self.statusbar.pop(2)
+        if status == "Valid":
+            self.statusbar.push(2, "Saved %s" % os.path.basename(filename))
+        else:
+            ww = WarnWindow(status)
+        return False
+
+    def show_summary(self,stub1,stub2):
+        # Summary table of current time window for each run, computed in
+        # background
+        if not self.init:
+            self.statusbar.pop(2)
+            self.statusbar.push(2, "Computing summary...")
+            job = threading.Thread(target = profile.run, args = (self.compute_summary, self.runs))
+            job.daemon = True
+            job.start()
+
+    def compute_summary(self, runs):
+        # Worker thread: summary rows of each run, windows are opened by
+        # main loop
+        try:
+            with self.lock:
+                tables = [(run, run.summary()) for run in runs]
+            status = "Valid"
+        except Exception as e:
+            tables = list()
+            status = "Failed to compute summary: %s" % e
+        gobject.idle_add(self.summary_computed, tables, status)
+
+    def summary_computed(self, tables, status):
+        # Main loop: show summary tables
+        self.statusbar.pop(2)
+        for run, rows in tables:
+            SummaryWindow(run, rows)
+        if status != "Valid":
+            ww = WarnWindow(status)
+        return False
+
+    def filter_window(self,stub1,stub2):
+        # Edit load filters, opened logs are loaded again with new filters
+        filter = FilterWindow(self.filter).run()
+        if filter is None:
+            return
+        self.filter = filter if filter.active() else None
+        if not self.init:
+            if len(self.runs) > 1:
+                self.start_load([run.path for run in self.runs], 1)
+            elif isinstance(self.log.path, basestring):
+                self.start_load([self.log.path], 0)
+            else:
+                self.start_load(self.log.path, 0)
+
     def label_win(self):
         # Sub-window with list of labels and transactions
         
@@ -816,7 +2899,7 @@ class PyLan:
             label.show()
             table.attach(label, 0, 3, 0, 1)
 
-            for label in sorted(self.log.transactions):
+            for label in sorted(set(sum([run.transactions for run in self.runs], []))):
                 button = gtk.CheckButton(label)
                 button.connect("clicked", self.label_options, label)
                 button.set_alignment(0,0.5)
@@ -831,7 +2914,7 @@ class PyLan:
 
             row+=1
             
-            for label in sorted(self.log.labels):
+            for label in sorted(set(sum([run.labels for run in self.runs], []))):
                 button = gtk.CheckButton(label)
                 button.connect("clicked", self.label_options, label)
                 button.set_alignment(0,0.5)
@@ -862,10 +2945,12 @@ class PyLan:
             self.label_list.append(label)
         else:
             self.label_list.remove(label)
+        self.stale()
     
     def total(self,widget):
         # Callback for checkbox
         self.total_status = not self.total_status
+        self.stale()
 
     def option_selector(self,option,stub):
         # Update settings/options
@@ -875,78 +2960,130 @@ class PyLan:
             self.trend_status = not self.trend_status
         elif option == 2:
             self.points_status = not self.points_status
+        self.stale()
             
     def range_selector(self,option,stub):
         # Throughput
         if option == 0:
             self.throughput_range = False
-            if self.title.count("Throughput"):
-                self.title='Throughput (kB/s)'
-        if option == 1:
+        elif option == 1:
             self.throughput_range = True
-            if self.title.count("Throughput"):
-                self.title='Throughput (MB/s)'
         # Time
         elif option == 2:
             self.time_range = False
-            if self.title.count("Response Time"):
-                self.title='Average Response Time (ms)'
-            elif self.title.count("Latency"):
-                self.title='Average Latency (ms)'
         elif option == 3:
             self.time_range = True
-            if self.title.count("Response Time"):
-                self.title='Average Response Time (s)'
-            elif self.title.count("Latency"):
-                self.title='Average Latency (s)'
-        if not self.init:
-            self.log.throughput_range   = self.throughput_range
-            self.log.time_range         = self.time_range
+        self.title = chart_title(self.active, self.time_range, self.throughput_range)
+        self.stale()
             
     def dpi_selector(self,option,stub):
         # Update DPI settings
         self.dpi = option
+        self.canvas_size()
+        self.canvas.draw_idle()
+        self.stale()
         
     def font_selector(self,option,stub):
         # Update Font settings
         pylab.rcParams['font.size'] = option
+        self.stale()
+        
+    def follow_selector(self,option,widget):
+        # Follow mode: check log for new rows every FOLLOW_INTERVAL seconds
+        if widget.get_active():
+            self.follow_timer = gobject.timeout_add(FOLLOW_INTERVAL*1000, self.follow)
+        elif self.follow_timer:
+            gobject.source_remove(self.follow_timer)
+            self.follow_timer = None
+    
+    def follow(self):
+        # Timer: read appended rows in background (unless previous check or
+        # loading is still in progress)
+        if not self.init and not self.tailing and not self.progress:
+            self.tailing = True
+            job = threading.Thread(target = profile.run, args = (self.tail_log, self.log, self.generation))
+            job.daemon = True
+            job.start()
+        return True
+    
+    def tail_log(self, log, generation):
+        # Worker thread: parse rows appended to log
+        status = None
+        rows = 0
+        with self.lock:
+            end_time = log.end_time
+            try:
+                rows = log.tail()
+            except (IOError, ValueError) as e:
+                status = str(e)
+        gobject.idle_add(self.log_tailed, log, rows, end_time, status)
+    
+    def log_tailed(self, log, rows, end_time, status):
+        # Main loop: extend time window (if it ends at the end of log) and
+        # redraw chart with new rows
+        self.tailing = False
+        if log is not self.log:
+            return False
+        if status:
+            self.statusbar.pop(0)
+            self.statusbar.push(0, "Follow mode: " + status)
+            return False
+        if rows:
+            end_point = self.spinner_em.get_value()*60 + self.spinner_eh.get_value()*3600
+            if end_point >= end_time//60*60:
+                self.spinner_eh.set_value(int(log.end_time/3600))
+                self.spinner_em.set_value(int((log.end_time-int(log.end_time/3600)*3600)/60))
+            self.refresh(None, None)
+            self.statusbar.pop(0)
+            self.statusbar.push(0, "%d new rows at %s" % (rows, time.strftime("%H:%M:%S")))
+        return False
+    
+    def trend_selector(self,option,stub):
+        # Trend method (see TRENDS)
+        self.trend_method = TRENDS[option][0]
+        self.stale()
+        
+    def profile_selector(self,option,stub):
+        # Profiling: off, stages or stages and cProfile statistics of jobs
+        profile.enable(option > 0, option == 2)
+        
+    def decimation_selector(self,option,stub):
+        # Decimation of dense chart lines (see DECIMATIONS)
+        self.decimation = DECIMATIONS[option][0]
+        self.stale()
+        
+    def window_selector(self,option,stub):
+        # Trend window in points
+        self.trend_window = option
+        self.stale()
+        
+    def worker_selector(self,option,stub):
+        # Number of processes parsing CSV logs (0 - one per CPU core)
+        self.workers = option or multiprocessing.cpu_count()
 
+    def cache_selector(self,option,widget):
+        # Take parsed logs from cache and save them there
+        self.cache = widget.get_active()
+    
+    def cache_limit_selector(self,option,stub):
+        # Cache size limit in GB (0 - unlimited), applied when log is saved
+        self.cache_limit = option << 30 or None
+    
+    def clear_cache(self,option,stub):
+        # Remove all cached logs (opened logs are parsed again next time)
+        removed = evict_cache(None, 0)
+        self.statusbar.pop(2)
+        self.statusbar.push(2, "%d cached logs removed" % removed)
+    
     def chart_selector(self,chart_type,stub):
         # Set chart title and type
-        if chart_type == 0:
-            if not self.time_range:
-                self.title='Average Response Time (ms)'
-            else:
-                self.title='Average Response Time (s)'
-            self.active = 'art'
-        elif chart_type == 1:
-            if not self.time_range:
-                self.title='Average Latency (ms)'
-            else:
-                self.title='Average Latency (s)'
-            self.active = 'lat'
-        elif chart_type == 2:
-            self.title='Responses per Second'
-            self.active = 'rpt'
-        elif chart_type == 3:
-            if not self.throughput_range:
-                self.title='Throughput (kB/s)'
-            else:
-                self.title='Throughput (MB/s)'
-            self.active = 'bpt'
-        elif chart_type == 4:
-            self.title='Error Rate'
-            self.active = 'err'
-        elif chart_type == 5:
-            self.title='Error Count'
-            self.active = 'errc'
-        elif chart_type == 6:
-            self.title='Active Threads'
-            self.active = 'vusers'
+        self.active = CHARTS[chart_type][0]
+        self.title  = chart_title(self.active, self.time_range, self.throughput_range)
+        self.stale()
         
 class ProgressBar:
-    # Obsolete class
-    def __init__(self):
+    # Progress of background job
+    def __init__(self, text = None):
         # Create the ProgressBar
         self.progress = gtk.Window(gtk.WINDOW_POPUP)
         self.progress.set_position(gtk.WIN_POS_CENTER_ALWAYS)
@@ -954,9 +3091,142 @@ class ProgressBar:
         self.progress.show()
 
         self.bar = gtk.ProgressBar()
+        if text:
+            self.bar.set_text(text)
         self.bar.show()        
         self.progress.add(self.bar)        
 
+    def update(self, fraction = None):
+        # Set done fraction (or just show activity if it is unknown)
+        if fraction is None:
+            self.bar.pulse()
+        else:
+            self.bar.set_fraction(fraction)
+
+    def destroy(self):
+        self.progress.destroy()
+
+class SummaryWindow:
+    # Summary table with export to CSV/JSON
+    def __init__(self, log, rows):
+        self.log    = log
+        self.rows   = rows
+        
+        self.window = gtk.Window()
+        self.window.set_title("Summary - " + log.name)
+        self.window.set_default_size(900, 300)
+        self.window.set_border_width(5)
+        vbox = gtk.VBox(False, 5)
+        self.window.add(vbox)
+        
+        # Table
+        store = gtk.ListStore(*[str for name, title in SUMMARY])
+        for row in rows:
+            store.append(["%.2f" % row[name] if isinstance(row[name], float) else str(row[name]) for name, title in SUMMARY])
+        view = gtk.TreeView(store)
+        for index, (name, title) in enumerate(SUMMARY):
+            column = gtk.TreeViewColumn(title, gtk.CellRendererText(), text = index)
+            column.set_resizable(True)
+            view.append_column(column)
+        scrolled_window = gtk.ScrolledWindow()
+        scrolled_window.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scrolled_window.add(view)
+        vbox.pack_start(scrolled_window, True, True, 0)
+        
+        # Export buttons
+        hbox = gtk.HBox(False, 5)
+        for title, extension in (("Export CSV", "csv"), ("Export JSON", "json")):
+            button = gtk.Button(title)
+            button.connect("clicked", self.export, extension)
+            hbox.pack_end(button, False, False, 0)
+        vbox.pack_start(hbox, False, False, 0)
+        self.window.show_all()
+    
+    def export(self, widget, extension):
+        # Save summary table to file
+        dialog = gtk.FileChooserDialog("Save...",
+                                None,
+                               gtk.FILE_CHOOSER_ACTION_SAVE,
+                               (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                                gtk.STOCK_SAVE, gtk.RESPONSE_OK))
+        dialog.set_default_response(gtk.RESPONSE_OK)
+        response = dialog.run()
+        if response == gtk.RESPONSE_OK:
+            filename = dialog.get_filename()
+            if not filename.endswith("." + extension):
+                filename += "." + extension
+            if extension == "csv":
+                self.log.summary2csv(filename, self.rows)
+            else:
+                self.log.summary2json(filename, self.rows)
+        dialog.destroy()
+
+class FilterWindow:
+    # Load filters: label regexes, label groups (one per line), row type,
+    # successful rows only and time range
+    def __init__(self, filter):
+        filter = filter or row_filter()
+        self.dialog = gtk.Dialog("Load Filters", None, gtk.DIALOG_MODAL,
+                                 (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                                  gtk.STOCK_OK, gtk.RESPONSE_OK))
+        self.dialog.set_default_size(450, 350)
+        table = gtk.Table(7, 2)
+        table.set_border_width(5)
+        table.set_row_spacings(5)
+        table.set_col_spacings(5)
+        
+        self.include    = gtk.Entry()
+        self.include.set_text(filter.include)
+        self.exclude    = gtk.Entry()
+        self.exclude.set_text(filter.exclude)
+        self.groups     = gtk.TextView()
+        self.groups.get_buffer().set_text("\n".join([(name + "=" if name or "=" in pattern else "") + pattern for pattern, name in filter.groups]))
+        scrolled_window = gtk.ScrolledWindow()
+        scrolled_window.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scrolled_window.add(self.groups)
+        self.types      = gtk.combo_box_new_text()
+        for types, title in ROW_TYPES:
+            self.types.append_text(title)
+        self.types.set_active([types for types, title in ROW_TYPES].index(filter.types))
+        self.success    = gtk.CheckButton("Successful rows only")
+        self.success.set_active(filter.success)
+        self.start      = gtk.Entry()
+        self.start.set_text("" if filter.start is None else str(filter.start))
+        self.stop       = gtk.Entry()
+        self.stop.set_text("" if filter.stop is None else str(filter.stop))
+        
+        for row, (title, widget) in enumerate((
+                ("Include labels (regex)", self.include),
+                ("Exclude labels (regex)", self.exclude),
+                ("Label groups (name=regex)", scrolled_window),
+                ("Rows", self.types),
+                ("", self.success),
+                ("From (seconds)", self.start),
+                ("To (seconds)", self.stop))):
+            label = gtk.Label(title)
+            label.set_alignment(0, 0)
+            table.attach(label, 0, 1, row, row+1, gtk.FILL, gtk.FILL)
+            table.attach(widget, 1, 2, row, row+1)
+        self.dialog.vbox.pack_start(table, True, True, 0)
+        self.dialog.show_all()
+    
+    def run(self):
+        # New filter, None if dialog was cancelled or filter is invalid
+        filter = None
+        if self.dialog.run() == gtk.RESPONSE_OK:
+            text = self.groups.get_buffer()
+            text = text.get_text(text.get_start_iter(), text.get_end_iter())
+            try:
+                filter = row_filter(self.include.get_text(), self.exclude.get_text(),
+                                    [parse_group(line) for line in text.splitlines() if line.strip()],
+                                    ROW_TYPES[self.types.get_active()][0], self.success.get_active(),
+                                    float(self.start.get_text()) if self.start.get_text().strip() else None,
+                                    float(self.stop.get_text()) if self.stop.get_text().strip() else None)
+            except (re.error, ValueError) as e:
+                ww = WarnWindow("Invalid load filter: %s" % e)
+        self.dialog.destroy()
+        return filter
+
 class WarnWindow:
     # Warnings
     def __init__(self, status):
@@ -966,8 +3236,229 @@ class WarnWindow:
         md.run()
         md.destroy()
 
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    Batch Mode
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# Logs shared with render processes (passed to each process on start, see
+# init_render): one log or runs compared on one chart
+batch_logs = list()
+
+def init_render(logs):
+    # Render process: keep logs of chart set
+    global batch_logs
+    batch_logs = logs
+
+def render_chart(task):
+    # Render one chart to PNG file with non-interactive backend
+    graph, label, time_int, title, options, filename = task
+    pylab.figure()
+    for log in batch_logs:
+        log.plot(graph, time_int, label, options.legend, title, options.trend, options.points, run = len(batch_logs) > 1)
+    with profile.stage("savefig"):
+        pylab.savefig(filename, dpi = options.dpi, transparent = False, format = "png")
+    pylab.close()
+    return filename
+
+def print_summary(name, rows):
+    # Print summary table as aligned text
+    table = [[title for column, title in SUMMARY]]
+    for row in rows:
+        table.append(["%.2f" % row[column] if isinstance(row[column], float) else str(row[column]) for column, title in SUMMARY])
+    widths = [max([len(line[index]) for line in table]) for index in range(len(SUMMARY))]
+    print name
+    for line in table:
+        print "  ".join([line[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(line[1:], widths[1:])])
+
+def batch(args):
+    # Command line mode: load each log once, aggregate all labels in one pass
+    # and render every chart type for every label and for the total. Logs
+    # can also be merged into one or compared on the same charts.
+    global batch_logs
+    
+    parser = OptionParser(usage = "%prog [options] LOG [LOG ...]")
+    parser.add_option("-o", "--output", default = "charts",
+        help = "output directory, one sub-directory per log [%default]")
+    parser.add_option("-g", "--granularity", type = "int", default = 60,
+        help = "time interval of chart points in seconds [%default]")
+    parser.add_option("-c", "--charts", default = ",".join([mode for mode, title in CHARTS]),
+        help = "comma separated chart types [%default]")
+    parser.add_option("--dpi", type = "int", default = 96,
+        help = "chart resolution [%default]")
+    parser.add_option("--font-size", type = "int", default = 8,
+        help = "font size in points [%default]")
+    parser.add_option("-p", "--processes", type = "int", default = 1,
+        help = "number of rendering processes (0 - one per CPU core) [%default]")
+    parser.add_option("-w", "--workers", type = "int", default = 1,
+        help = "number of CSV parsing processes (0 - one per CPU core) [%default]")
+    parser.add_option("--seconds", action = "store_true", default = False,
+        help = "response time and latency in seconds instead of ms")
+    parser.add_option("--mbytes", action = "store_true", default = False,
+        help = "throughput in MB/s instead of kB/s")
+    parser.add_option("--legend", action = "store_true", default = False,
+        help = "add legend to charts")
+    parser.add_option("--trend", action = "store_true", default = False,
+        help = "add trend lines to charts")
+    parser.add_option("--trend-method", choices = [method for method, name in TRENDS], default = "sma",
+        help = "trend method: " + ", ".join(["%s (%s)" % trend for trend in TRENDS]) + " [%default]")
+    parser.add_option("--trend-window", type = "int", default = 10,
+        help = "trend window in points [%default]")
+    parser.add_option("--decimation", choices = [method for method, name in DECIMATIONS], default = "lttb",
+        help = "decimation of lines denser than chart width: " + ", ".join(["%s (%s)" % method for method in DECIMATIONS]) + " [%default]")
+    parser.add_option("--points", action = "store_true", default = False,
+        help = "plot line points")
+    parser.add_option("--no-cache", dest = "cache", action = "store_false", default = True,
+        help = "do not use cache of parsed logs")
+    parser.add_option("--cache-limit", type = "int", default = CACHE_LIMIT >> 20, metavar = "MB",
+        help = "evict the least recently used logs from cache above this size (0 - unlimited) [%default]")
+    parser.add_option("--summary", action = "store_true", default = False,
+        help = "print summary table and save it in CSV and JSON formats")
+    parser.add_option("--export", default = "",
+        help = "comma separated export formats: csv (all columns), npz (NumPy columns), series (aggregated chart series)")
+    parser.add_option("--profile", metavar = "FILE",
+        help = "save times of processing stages to JSON file (use -p 1 to include rendering)")
+    parser.add_option("--cprofile", action = "store_true", default = False,
+        help = "save cProfile statistics next to --profile file (.prof)")
+    parser.add_option("--include", default = "", metavar = "REGEX",
+        help = "load only labels matching regex")
+    parser.add_option("--exclude", default = "", metavar = "REGEX",
+        help = "skip labels matching regex")
+    parser.add_option("--group", action = "append", default = [], metavar = "[NAME=]REGEX",
+        help = "chart labels matching regex as one series (named by regex or NAME, may refer to regex groups), "
+               "name ends at the first '=' and is required if regex contains '=', can be repeated")
+    parser.add_option("--type", choices = [types for types, title in ROW_TYPES], default = "all",
+        help = "load rows of type: " + ", ".join(["%s (%s)" % types for types in ROW_TYPES]) + " [%default]")
+    parser.add_option("--success-only", action = "store_true", default = False,
+        help = "load successful rows only")
+    parser.add_option("--from", dest = "start", type = "float", metavar = "SECONDS",
+        help = "load rows from given second of test")
+    parser.add_option("--to", dest = "stop", type = "float", metavar = "SECONDS",
+        help = "load rows up to given second of test")
+    parser.add_option("--merge", action = "store_true", default = False,
+        help = "merge all logs into one (e.g. logs of distributed test)")
+    parser.add_option("--compare", action = "store_true", default = False,
+        help = "compare logs (runs) on the same charts")
+    options, logs = parser.parse_args(args)
+    if not logs:
+        parser.error("no log files")
+    
+    charts      = [mode for mode in options.charts.split(",") if mode]
+    unknown     = [mode for mode in charts if mode not in dict(CHARTS)]
+    if unknown:
+        parser.error("unknown chart types: %s (choose from %s)" % (", ".join(unknown), ", ".join([mode for mode, title in CHARTS])))
+    
+    pylab.switch_backend("Agg")
+    pylab.rcParams['font.size'] = options.font_size
+    processes   = options.processes or multiprocessing.cpu_count()
+    workers     = options.workers or multiprocessing.cpu_count()
+    try:
+        filter  = row_filter(options.include, options.exclude, [parse_group(group) for group in options.group],
+                             options.type, options.success_only, options.start, options.stop)
+    except re.error as e:
+        parser.error("invalid regex: %s" % e)
+    
+    if options.merge:
+        jobs = [[logs]]
+    elif options.compare:
+        jobs = [logs]
+    else:
+        jobs = [[path] for path in logs]
+    
+    # Times of processing stages and cProfile statistics of this process
+    if options.profile:
+        profile.enable(True, options.cprofile)
+        if profile.functions is not None:
+            profile.functions.enable()
+    
+    for paths in jobs:
+        started = time.time()
+        batch_logs = list()
+        for path in paths:
+            log = jmlog(path, options.mbytes, options.seconds, options.cache, workers, filter = filter, cache_limit = options.cache_limit << 20 or None)
+            if log.status != "Valid":
+                sys.stderr.write("%s: %s\n" % (log.name, log.status))
+                break
+            log.trend_method    = options.trend_method
+            log.trend_window    = options.trend_window
+            log.decimation      = options.decimation
+            log.max_points      = int(pylab.rcParams['figure.figsize'][0]*options.dpi)
+            print "%s: %s" % (log.name, log.ingest_report())
+            
+            # Aggregate all labels at once
+            log.aggregate(options.granularity, None, [graph for graph in charts if graph.count('_p')] != [])
+            batch_logs.append(log)
+        if len(batch_logs) < len(paths):
+            continue
+        path = " vs ".join([log.name for log in batch_logs])
+        
+        # Chart set
+        output = os.path.join(options.output, re.sub(r"[^\w.+-]+", "_", path))
+        if not os.path.isdir(output):
+            os.makedirs(output)
+        tasks = list()
+        for graph in charts:
+            title = chart_title(graph, options.seconds, options.mbytes)
+            if graph == 'vusers':
+                tasks.append((graph, None, options.granularity, title, options,
+                    os.path.join(output, graph + ".png")))
+                continue
+            for label in sorted(set(sum([log.transactions for log in batch_logs], []))) + sorted(set(sum([log.labels for log in batch_logs], []))):
+                tasks.append((graph, label, options.granularity, title + " - " + label, options,
+                    os.path.join(output, "%s_%s.png" % (graph, re.sub(r"[^\w.-]+", "_", label)))))
+            if graph[:3] != 'art' and graph[:3] != 'lat':
+                tasks.append((graph + '_total', None, options.granularity, title + " - Total", options,
+                    os.path.join(output, graph + "_Total.png")))
+        
+        # Render charts, optionally in a pool of processes, loaded logs are
+        # passed to them explicitly (inherited on fork, pickled on spawn)
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, init_render, (batch_logs,))
+            try:
+                pool.map(render_chart, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for task in tasks:
+                render_chart(task)
+        
+        # Summary table of each log
+        if options.summary:
+            for log in batch_logs:
+                rows = log.summary()
+                name = os.path.join(output, re.sub(r"[^\w.+-]+", "_", log.name) + ".summary")
+                log.summary2csv(name + ".csv", rows)
+                log.summary2json(name + ".json", rows)
+                print_summary(log.name, rows)
+        
+        # Log in export formats
+        for log in batch_logs:
+            name = os.path.join(output, re.sub(r"[^\w.+-]+", "_", log.name))
+            for export in [export for export in options.export.split(",") if export]:
+                if export == "csv":
+                    log.export2csv(name + ".export.csv", True)
+                elif export == "npz":
+                    log.export2npz(name + ".npz")
+                elif export == "series":
+                    log.export_series(name + ".series.csv", options.granularity)
+                else:
+                    sys.stderr.write("Unknown export format: %s\n" % export)
+        
+        print "%s: %d charts in %.1f s -> %s" % (path, len(tasks), time.time()-started, output)
+    
+    if options.profile:
+        if profile.functions is not None:
+            profile.functions.disable()
+        profile.save(options.profile)
+        sys.stderr.write(profile.report(len(profile.stages)) + "\n")
+
 def main():
-    PyLan()
-    gtk.main()    
+    # Without arguments start GUI, otherwise render charts in batch mode
+    if len(sys.argv) > 1:
+        batch(sys.argv[1:])
+    else:
+        gobject.threads_init()
+        PyLan()
+        gtk.main()    
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
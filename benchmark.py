@@ -0,0 +1,323 @@
+'''
+Copyright (c) 2011, Pavel Paulau <Pavel.Paulau@gmail.com>
+
+All rights reserved.
+
+Redistribution and use of this software in source and binary forms, with or
+without modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+* Neither the name of the author nor the names of contributors may be used
+to endorse or promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    Benchmarks of PyLan: synthetic JMeter logs (CSV and XML) of given size are
+    loaded, aggregated and rendered, every case runs in its own process and
+    reports wall time, rows per second and peak RSS. Results are written in
+    JSON format for comparison between versions:
+
+        python benchmark.py -r 10000,1000000 -o results.json
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+import numpy
+from csv import writer
+from hashlib import md5
+from optparse import OptionParser
+import subprocess
+import platform
+import shutil
+import json
+import time
+import sys
+import os
+
+import PyLan
+
+# Start time of synthetic logs (ms)
+ORIGIN = 1300000000000
+
+# Rows generated at once
+GENERATOR_ROWS = 1000000
+
+# Benchmark cases: name and description
+CASES = (
+    ("load",        "parse log (no cache)"),
+    ("load_cached", "load parsed log from cache"),
+) + tuple(("agg_" + mode, "aggregate " + title) for mode, title in PyLan.CHARTS) + tuple(
+    ("trend_" + method, name + " of every label") for method, name in PyLan.TRENDS) + (
+    ("render",      "render every chart type with all labels"),
+)
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    Synthetic logs
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+def samples(random, first, rows, total, options):
+    # Columns of sample rows first ... first+rows-1 out of total: timestamps
+    # are sorted and spread over test duration, response times are log-normal
+    # (mean depends on label), threads ramp up during the first 10% of test
+    duration = options.duration*1000
+    ts      = numpy.sort(random.randint(first*duration//total, (first+rows)*duration//total + 1, rows)).astype(numpy.int64)
+    label   = random.randint(0, options.labels, rows)
+    elapsed = (random.lognormal(numpy.log(100.0), 0.6, rows)*(1 + label % 7)).astype(numpy.int64)
+    latency = (elapsed*random.uniform(0.1, 0.9, rows)).astype(numpy.int64)
+    success = random.uniform(0, 1, rows) >= options.errors
+    threads = numpy.clip(numpy.ceil(options.threads*ts/(0.1*duration)), 1, options.threads).astype(numpy.int64)
+    return {
+        "timeStamp":    ORIGIN + ts,
+        "elapsed":      elapsed,
+        "Latency":      latency,
+        "label":        label,
+        "success":      success,
+        "bytes":        random.randint(500, 50000, rows),
+        "allThreads":   threads,
+        "thread":       random.randint(1, options.threads + 1, rows),
+    }
+
+def generate_csv(path, rows, options):
+    # JMeter CSV log with default columns
+    random = numpy.random.RandomState(options.seed)
+    log_file = open(path, "wb")
+    output = writer(log_file)
+    output.writerow(("timeStamp","elapsed","label","responseCode","responseMessage","threadName","dataType","success","bytes","allThreads","Latency"))
+    for first in range(0, rows, GENERATOR_ROWS):
+        size = min(GENERATOR_ROWS, rows-first)
+        data = samples(random, first, size, rows, options)
+        output.writerows(zip(
+            data["timeStamp"].tolist(),
+            data["elapsed"].tolist(),
+            ["Request %d" % label for label in data["label"].tolist()],
+            numpy.where(data["success"], "200", "500").tolist(),
+            numpy.where(data["success"], "OK", "Internal Server Error").tolist(),
+            ["Thread Group 1-%d" % thread for thread in data["thread"].tolist()],
+            ["text"]*size,
+            numpy.where(data["success"], "true", "false").tolist(),
+            data["bytes"].tolist(),
+            data["allThreads"].tolist(),
+            data["Latency"].tolist(),
+        ))
+    log_file.close()
+
+def generate_xml(path, rows, options):
+    # JMeter XML log: transactions (sample) of 'nesting' HTTP samples
+    # (httpSample) each, HTTP samples of transaction follow one another
+    random = numpy.random.RandomState(options.seed)
+    nesting = options.nesting
+    log_file = open(path, "wb")
+    log_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<testResults version="1.2">\n')
+    transactions = max(1, rows // (nesting + 1))
+    for first in range(0, transactions, GENERATOR_ROWS):
+        size = min(GENERATOR_ROWS, transactions-first)
+        data = dict((name, values.tolist()) for name, values in samples(random, first, size, transactions, options).items())
+        requests = dict((name, values.tolist()) for name, values in samples(random, first*nesting, size*nesting, transactions*nesting, options).items())
+        lines = list()
+        for row in range(size):
+            ts = data["timeStamp"][row]
+            children = list()
+            total = 0
+            for child in range(row*nesting, (row+1)*nesting):
+                children.append('<httpSample t="%d" lt="%d" ts="%d" s="%s" lb="Request %d" by="%d" ng="%d" na="%d"/>\n' % (
+                    requests["elapsed"][child], requests["Latency"][child], ts + total,
+                    "true" if requests["success"][child] else "false", requests["label"][child],
+                    requests["bytes"][child], data["allThreads"][row], data["allThreads"][row]))
+                total += requests["elapsed"][child]
+            lines.append('<sample t="%d" lt="0" ts="%d" s="%s" lb="Transaction %d" by="%d" ng="%d" na="%d">\n' % (
+                total, ts, "true" if data["success"][row] else "false", data["label"][row] % max(1, options.labels // 4),
+                data["bytes"][row], data["allThreads"][row], data["allThreads"][row]))
+            lines.extend(children)
+            lines.append('</sample>\n')
+        log_file.write("".join(lines))
+    log_file.write('</testResults>\n')
+    log_file.close()
+
+def synthetic_log(format, rows, options):
+    # Path of synthetic log (generated unless it exists)
+    name = "bench_%d_%dl_%dt_%ge_%ds_%dn_%d.%s" % (rows, options.labels, options.threads, options.errors,
+                                                   options.duration, options.nesting, options.seed, format)
+    path = os.path.join(options.data, name)
+    if not os.path.exists(path):
+        started = time.time()
+        (generate_csv if format == "csv" else generate_xml)(path + ".tmp", rows, options)
+        os.rename(path + ".tmp", path)
+        sys.stderr.write("%s: generated in %.1f s\n" % (name, time.time()-started))
+    return path
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+    Benchmark cases
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+def chart_lines(log, mode):
+    # Lines of chart type rendered in batch mode: every label and the total
+    if mode == "vusers":
+        return [(mode, None)]
+    lines = [(mode, label) for label in log.transactions + log.labels]
+    if mode[:3] not in ("art", "lat"):
+        lines.append((mode + "_total", None))
+    return lines
+
+def run_case(case, path, options):
+    # Run one case in current process, only the case itself is timed.
+    # Aggregation and render cases check that labels and totals of the
+    # interval are aggregated in one pass (as in batch mode).
+    started = time.time()
+    log = PyLan.jmlog(path, False, False, case != "load", options.workers)
+    if not case in ("load", "load_cached"):
+        PyLan.profile.enable()
+        started = time.time()
+        if case.startswith("agg_"):
+            mode = case[4:]
+            log.start, log.end = 0, log.end_time
+            log.aggregate(options.granularity, None, mode.count("_p") > 0)
+            for graph, label in chart_lines(log, mode):
+                log.log_agg(options.granularity, label, graph)
+        elif case.startswith("trend_"):
+            log.start, log.end = 0, log.end_time
+            lines = [log.log_agg(options.granularity, label, "art")[1] for label in log.transactions + log.labels]
+            started = time.time()
+            for points in lines:
+                log.trend(points, case[6:])
+        elif case == "render":
+            log.start, log.end = 0, log.end_time
+            log.max_points = int(PyLan.pylab.rcParams['figure.figsize'][0]*options.dpi)
+            chart = os.path.join(options.data, "bench_chart_%d.png" % os.getpid())
+            log.aggregate(options.granularity, None, True)
+            for mode, title in PyLan.CHARTS:
+                PyLan.pylab.figure()
+                for graph, label in chart_lines(log, mode):
+                    log.plot(graph, options.granularity, label, False, title)
+                PyLan.pylab.savefig(chart, dpi = options.dpi, format = "png")
+                PyLan.pylab.close()
+            os.remove(chart)
+        else:
+            raise ValueError("Unknown case: %s" % case)
+    seconds = time.time()-started
+
+    if log.status != "Valid":
+        raise ValueError("%s: %s" % (path, log.status))
+    aggregations = PyLan.profile.stages.get("aggregate", (0,))[0]
+    if (case.startswith("agg_") or case == "render") and aggregations > 1:
+        raise ValueError("%s: interval aggregated %d times instead of once" % (case, aggregations))
+    rows = len(log.data["timeStamp"])
+    return {
+        "case":             case,
+        "rows":             rows,
+        "seconds":          round(seconds, 4),
+        "rows_per_second":  round(rows/seconds) if seconds else None,
+        "peak_rss_mb":      round(PyLan.peak_rss(), 1),
+        "aggregations":     aggregations,
+    }
+
+def spawn(case, path, options):
+    # Run case in new process (peak RSS of each case is measured separately)
+    command = [sys.executable, os.path.abspath(__file__), "--case", case, "--log", path,
+               "-g", str(options.granularity), "-w", str(options.workers), "--dpi", str(options.dpi),
+               "-d", options.data]
+    child = subprocess.Popen(command, stdout = subprocess.PIPE)
+    output = child.communicate()[0]
+    if child.returncode:
+        raise RuntimeError("%s failed on %s" % (case, path))
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    # Generate logs, run every case on every log and write results
+    parser = OptionParser(usage = "usage: %prog [options]",
+        description = "Benchmarks of loading, aggregation and rendering of synthetic JMeter logs.")
+    parser.add_option("-r", "--rows", default = "10000,100000,1000000",
+        help = "comma separated log sizes in rows (e.g. up to 50000000) [%default]")
+    parser.add_option("-f", "--formats", default = "csv,xml",
+        help = "comma separated log formats: csv, xml [%default]")
+    parser.add_option("-c", "--cases", default = ",".join([case for case, description in CASES]),
+        help = "comma separated cases: " + ", ".join(["%s (%s)" % case for case in CASES]))
+    parser.add_option("-o", "--output", default = None,
+        help = "JSON file with results [stdout]")
+    parser.add_option("-d", "--data", default = "benchmark_data",
+        help = "directory of synthetic logs and of their cache [%default]")
+    parser.add_option("-g", "--granularity", type = "int", default = 10,
+        help = "time interval of chart points in seconds [%default]")
+    parser.add_option("-w", "--workers", type = "int", default = 1,
+        help = "CSV parser processes, 0 - all cores [%default]")
+    parser.add_option("--dpi", type = "int", default = 96,
+        help = "resolution of rendered charts [%default]")
+    parser.add_option("--labels", type = "int", default = 20,
+        help = "number of sample labels [%default]")
+    parser.add_option("--threads", type = "int", default = 50,
+        help = "number of threads [%default]")
+    parser.add_option("--errors", type = "float", default = 0.01,
+        help = "ratio of failed samples [%default]")
+    parser.add_option("--duration", type = "int", default = 3600,
+        help = "test duration in seconds [%default]")
+    parser.add_option("--nesting", type = "int", default = 3,
+        help = "HTTP samples per transaction of XML logs [%default]")
+    parser.add_option("--seed", type = "int", default = 1,
+        help = "seed of random generator [%default]")
+    parser.add_option("--case", help = "run single case in current process (internal)")
+    parser.add_option("--log", help = "log of single case (internal)")
+    options, args = parser.parse_args()
+
+    options.workers = options.workers or PyLan.multiprocessing.cpu_count()
+    if not os.path.isdir(options.data):
+        os.makedirs(options.data)
+
+    # Cache of parsed logs is kept next to synthetic logs
+    PyLan.CACHE_DIR = os.path.join(options.data, "cache")
+    PyLan.pylab.switch_backend("Agg")
+
+    if options.case:
+        print json.dumps(run_case(options.case, options.log, options))
+        return
+
+    cases = [case for case in options.cases.split(",") if case]
+    results = list()
+    for rows in [int(rows) for rows in options.rows.split(",") if rows]:
+        for format in [format for format in options.formats.split(",") if format]:
+            path = synthetic_log(format, rows, options)
+            if os.path.isdir(PyLan.CACHE_DIR):
+                shutil.rmtree(PyLan.CACHE_DIR)
+
+            # The first cached load writes the cache
+            spawn("load_cached", path, options)
+            for case in cases:
+                result = spawn(case, path, options)
+                result["format"] = format
+                result["log_rows"] = rows
+                results.append(result)
+                sys.stderr.write("%-14s %-4s %10d rows %9.3f s %12s rows/s %8.1f MB\n" % (
+                    case, format, result["rows"], result["seconds"], result["rows_per_second"], result["peak_rss_mb"]))
+
+    report = {
+        "created":      time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source":       md5(open(PyLan.__file__.replace(".pyc", ".py"), "rb").read()).hexdigest(),
+        "python":       platform.python_version(),
+        "numpy":        numpy.__version__,
+        "matplotlib":   PyLan.matplotlib.__version__,
+        "platform":     platform.platform(),
+        "cpus":         PyLan.multiprocessing.cpu_count(),
+        "options":      dict((name, getattr(options, name)) for name in ("granularity", "workers", "dpi", "labels",
+                            "threads", "errors", "duration", "nesting", "seed")),
+        "results":      results,
+    }
+    output = open(options.output, "w") if options.output else sys.stdout
+    json.dump(report, output, indent = 2, sort_keys = True)
+    output.write("\n")
+    if options.output:
+        output.close()
+
+if __name__ == "__main__":
+    main()